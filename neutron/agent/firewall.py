@@ -84,6 +84,14 @@ class FirewallDriver(object):
         """Stop filtering port."""
         raise NotImplementedError()
 
+    def update_security_group_members(self, sg_id, sg_members):
+        """Update the member addresses of a remote security group.
+
+        Only called for drivers matching remote groups by their members
+        rather than by one rule per member address.
+        """
+        pass
+
     def filter_defer_apply_on(self):
         """Defer application of filtering rule."""
         pass
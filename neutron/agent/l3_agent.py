@@ -17,7 +17,12 @@
 # @author: Dan Wendlandt, Nicira, Inc
 #
 
+import collections
+import itertools
+import time
+
 import eventlet
+import eventlet.queue
 import netaddr
 from oslo.config import cfg
 
@@ -50,6 +55,9 @@ NS_PREFIX = 'qrouter-'
 INTERNAL_DEV_PREFIX = 'qr-'
 EXTERNAL_DEV_PREFIX = 'qg-'
 RPC_LOOP_INTERVAL = 1
+# Router updates with lower values are processed first
+PRIORITY_RPC = 0
+PRIORITY_SYNC_ROUTERS_TASK = 1
 
 
 class L3PluginApi(proxy.RpcProxy):
@@ -138,6 +146,91 @@ class RouterInfo(object):
         self._snat_action = None
 
 
+class RouterUpdate(object):
+    """A router to process, or to remove when router is None.
+
+    Updates are ordered by priority, then by the time their router data
+    was fetched from the server.
+    """
+
+    _sequence = itertools.count()
+
+    def __init__(self, router_id, priority, router=None, timestamp=None):
+        self.id = router_id
+        self.priority = priority
+        self.router = router
+        self.timestamp = timestamp or time.time()
+        # Break ties between updates queued at the same time
+        self._seq = next(self._sequence)
+
+    def __lt__(self, other):
+        return ((self.priority, self.timestamp, self._seq) <
+                (other.priority, other.timestamp, other._seq))
+
+
+class RouterProcessingQueue(object):
+    """Processes router updates concurrently, by order of priority.
+
+    Queued updates are dispatched to a pool of at most `workers` green
+    threads. Updates of the same router are never processed concurrently:
+    an update dispatched while its router is being processed waits for the
+    worker processing the router, which then processes it in turn. Updates
+    whose router data is older than the data last processed for the router
+    are skipped.
+    """
+
+    def __init__(self, process, workers):
+        self._process = process
+        self._queue = eventlet.queue.PriorityQueue()
+        self._pool = eventlet.GreenPool(workers)
+        # Maps the routers being processed to their waiting updates
+        self._waiting = {}
+        self._timestamps = {}
+
+    def add(self, update):
+        self._queue.put(update)
+
+    def qsize(self):
+        return self._queue.qsize() + sum(
+            len(waiting) for waiting in self._waiting.itervalues())
+
+    def run(self):
+        """Dispatch the queued updates forever."""
+        while True:
+            self._dispatch(self._queue.get())
+
+    def process_all(self):
+        """Dispatch the queued updates and wait until they are processed."""
+        while not self._queue.empty():
+            self._dispatch(self._queue.get())
+        self._pool.waitall()
+
+    def _dispatch(self, update):
+        if update.id in self._waiting:
+            self._waiting[update.id].append(update)
+            return
+        self._waiting[update.id] = collections.deque()
+        # Blocks while all the workers are busy, leaving any update queued
+        # meanwhile a chance to overtake lower priority ones.
+        self._pool.spawn_n(self._process_router_updates, update)
+
+    def _process_router_updates(self, update):
+        try:
+            while True:
+                if update.timestamp >= self._timestamps.get(update.id, 0):
+                    self._timestamps[update.id] = update.timestamp
+                    self._process(update)
+                else:
+                    LOG.debug(_('Skipping outdated update of router %s'),
+                              update.id)
+                waiting = self._waiting[update.id]
+                if not waiting:
+                    break
+                update = waiting.popleft()
+        finally:
+            del self._waiting[update.id]
+
+
 class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     """Manager for L3NatAgent
 
@@ -185,6 +278,10 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
                           'socket')),
+        cfg.IntOpt('router_processing_workers',
+                   default=8,
+                   help=_("Maximum number of routers processed "
+                          "concurrently.")),
     ]
 
     def __init__(self, host, conf=None):
@@ -213,9 +310,15 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self.updated_routers = set()
         self.removed_routers = set()
         self.sync_progress = False
+        self._latencies = []
+        self._queue = RouterProcessingQueue(
+            self._process_router_update,
+            self.conf.router_processing_workers)
         if self.conf.use_namespaces:
             self._destroy_router_namespaces(self.conf.router_id)
 
+        eventlet.spawn_n(self._queue.run)
+
         self.rpc_loop = loopingcall.FixedIntervalLoopingCall(
             self._rpc_loop)
         self.rpc_loop.start(interval=RPC_LOOP_INTERVAL)
@@ -635,8 +738,43 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         LOG.debug(_('Got router added to agent :%r'), payload)
         self.routers_updated(context, payload)
 
-    def _process_routers(self, routers, all_routers=False):
-        pool = eventlet.GreenPool()
+    def _process_router_update(self, update):
+        try:
+            if update.router is None:
+                if update.id in self.router_info:
+                    self._router_removed(update.id)
+                return
+            router = update.router
+            if router['id'] not in self.router_info:
+                self._router_added(router['id'], router)
+            ri = self.router_info[router['id']]
+            ri.router = router
+            self.process_router(ri)
+        except Exception:
+            LOG.exception(_("Failed processing router %s"), update.id)
+            self.fullsync = True
+            return
+        latency = time.time() - update.timestamp
+        self._latencies.append(latency)
+        LOG.debug(_("Processed router %(id)s %(latency).3f seconds after "
+                    "fetching it"), {'id': update.id, 'latency': latency})
+
+    def get_router_processing_stats(self):
+        """Return and reset the router processing latency statistics.
+
+        Latencies are measured from the time router data was fetched from
+        the server to the end of the processing of the router.
+        """
+        latencies, self._latencies = self._latencies, []
+        stats = {'routers_processed': len(latencies),
+                 'router_update_queue_size': self._queue.qsize()}
+        if latencies:
+            stats['router_processing_latency_avg'] = (
+                sum(latencies) / len(latencies))
+            stats['router_processing_latency_max'] = max(latencies)
+        return stats
+
+    def _process_routers(self, routers, all_routers=False, timestamp=None):
         if (self.conf.external_network_bridge and
             not ip_lib.device_exists(self.conf.external_network_bridge)):
             LOG.error(_("The external network bridge '%s' does not exist"),
@@ -644,6 +782,14 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             return
 
         target_ex_net_id = self._fetch_external_net_id()
+        # Routers are processed asynchronously, user triggered updates
+        # first, so that they are not delayed by periodic full syncs.
+        if all_routers:
+            priority = PRIORITY_SYNC_ROUTERS_TASK
+        else:
+            priority = PRIORITY_RPC
+        # The time the routers were fetched, to skip outdated updates
+        timestamp = timestamp or time.time()
         # if routers are all the routers we have (They are from router sync on
         # starting or when error occurs during running), we seek the
         # routers which should be removed.
@@ -670,15 +816,12 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             if ex_net_id and ex_net_id != target_ex_net_id:
                 continue
             cur_router_ids.add(r['id'])
-            if r['id'] not in self.router_info:
-                self._router_added(r['id'], r)
-            ri = self.router_info[r['id']]
-            ri.router = r
-            pool.spawn_n(self.process_router, ri)
+            self._queue.add(RouterUpdate(r['id'], priority, router=r,
+                                         timestamp=timestamp))
         # identify and remove routers that no longer exist
         for router_id in prev_router_ids - cur_router_ids:
-            pool.spawn_n(self._router_removed, router_id)
-        pool.waitall()
+            self._queue.add(RouterUpdate(router_id, priority,
+                                         timestamp=timestamp))
 
     @lockutils.synchronized('l3-agent', 'neutron-')
     def _rpc_loop(self):
@@ -690,9 +833,10 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             if self.updated_routers:
                 router_ids = list(self.updated_routers)
                 self.updated_routers.clear()
+                timestamp = time.time()
                 routers = self.plugin_rpc.get_routers(
                     self.context, router_ids)
-                self._process_routers(routers)
+                self._process_routers(routers, timestamp=timestamp)
             self._process_router_delete()
         except Exception:
             LOG.exception(_("Failed synchronizing routers"))
@@ -701,7 +845,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     def _process_router_delete(self):
         current_removed_routers = list(self.removed_routers)
         for router_id in current_removed_routers:
-            self._router_removed(router_id)
+            self._queue.add(RouterUpdate(router_id, PRIORITY_RPC))
             self.removed_routers.remove(router_id)
 
     def _router_ids(self):
@@ -719,11 +863,13 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             router_ids = self._router_ids()
             self.updated_routers.clear()
             self.removed_routers.clear()
+            timestamp = time.time()
             routers = self.plugin_rpc.get_routers(
                 context, router_ids)
 
             LOG.debug(_('Processing :%r'), routers)
-            self._process_routers(routers, all_routers=True)
+            self._process_routers(routers, all_routers=True,
+                                  timestamp=timestamp)
             self.fullsync = False
         except Exception:
             LOG.exception(_("Failed synchronizing routers"))
@@ -808,6 +954,7 @@ class L3NATAgentWithStateReport(L3NATAgent):
         configurations['ex_gw_ports'] = num_ex_gw_ports
         configurations['interfaces'] = num_interfaces
         configurations['floating_ips'] = num_floating_ips
+        configurations.update(self.get_router_processing_stats())
         try:
             self.state_rpc.report_state(self.context, self.agent_state,
                                         self.use_call)
@@ -0,0 +1,97 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Manages the ipsets used to match security group members."""
+
+from neutron.agent.linux import utils as linux_utils
+from neutron.common import constants
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# ipset names are limited to 31 characters
+MAX_NAME_LEN = 31
+NAME_PREFIX = {constants.IPv4: 'NIPv4',
+               constants.IPv6: 'NIPv6'}
+FAMILY = {constants.IPv4: 'inet',
+          constants.IPv6: 'inet6'}
+
+
+def get_name(id, ethertype):
+    """Return the name of the ipset holding the members of a group."""
+    return ('%s%s' % (NAME_PREFIX[ethertype], id))[:MAX_NAME_LEN]
+
+
+class IpsetManager(object):
+    """Wrapper for ipset.
+
+    Keeps track of the members of each set it manages so that membership
+    updates only add and delete the addresses that changed. All the
+    changes to a set are applied with a single 'ipset restore'.
+    """
+
+    def __init__(self, execute=None, root_helper=None):
+        self.execute = execute or linux_utils.execute
+        self.root_helper = root_helper
+        # Maps the name of each set we manage to its members
+        self.ipsets = {}
+
+    def set_members(self, id, ethertype, member_ips):
+        """Set the members of the ipset of a group.
+
+        The set is created if needed. Members are CIDRs, or addresses,
+        of the given ethertype.
+        """
+        name = get_name(id, ethertype)
+        new_members = set(member_ips)
+        lines = []
+        if name in self.ipsets:
+            old_members = self.ipsets[name]
+        else:
+            # The set may be left over from a previous run, so start afresh
+            lines.append('create %s hash:net family %s' %
+                         (name, FAMILY[ethertype]))
+            lines.append('flush %s' % name)
+            old_members = set()
+        lines += ['add %s %s' % (name, ip)
+                  for ip in sorted(new_members - old_members)]
+        lines += ['del %s %s' % (name, ip)
+                  for ip in sorted(old_members - new_members)]
+        if lines:
+            try:
+                self._restore(lines)
+            except RuntimeError:
+                # The state of the set is unknown, rebuild it next time
+                self.ipsets.pop(name, None)
+                raise
+        self.ipsets[name] = new_members
+        return name
+
+    def destroy(self, name):
+        """Destroy a set, which must not be referenced by any rule."""
+        try:
+            self.execute(['ipset', 'destroy', name],
+                         root_helper=self.root_helper)
+        except RuntimeError:
+            LOG.exception(_('Unable to destroy ipset %s'), name)
+            return
+        self.ipsets.pop(name, None)
+
+    def _restore(self, lines):
+        self.execute(['ipset', 'restore', '-exist'],
+                     process_input='\n'.join(lines) + '\n',
+                     root_helper=self.root_helper)
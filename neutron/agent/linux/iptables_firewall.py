@@ -19,7 +19,9 @@ import netaddr
 from oslo.config import cfg
 
 from neutron.agent import firewall
+from neutron.agent.linux import ipset_manager
 from neutron.agent.linux import iptables_manager
+from neutron.agent import securitygroups_rpc as sg_rpc
 from neutron.common import constants
 from neutron.openstack.common import log as logging
 
@@ -33,6 +35,8 @@ CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o',
                      SPOOF_FILTER: 's'}
 LINUX_DEV_LEN = 14
+IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
+                   EGRESS_DIRECTION: 'dst'}
 
 
 class IptablesFirewallDriver(firewall.FirewallDriver):
@@ -49,18 +53,48 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self._add_fallback_chain_v4v6()
         self._defer_apply = False
         self._pre_defer_filtered_ports = None
+        self.enable_ipset = sg_rpc.is_ipset_enabled()
+        if self.enable_ipset:
+            self.ipset = ipset_manager.IpsetManager(
+                root_helper=cfg.CONF.AGENT.root_helper)
+        # ipsets referenced by the rules set up for the filtered ports
+        self._used_ipsets = set()
 
     @property
     def ports(self):
         return self.filtered_ports
 
+    def update_security_group_members(self, sg_id, sg_members):
+        """Update the ipsets holding the members of a security group.
+
+        :param sg_members: dict mapping each ethertype to the member
+                           addresses of that ethertype
+        """
+        if not self.enable_ipset:
+            return
+        LOG.debug(_("Updating members of security group %s"), sg_id)
+        for ethertype in (constants.IPv4, constants.IPv6):
+            self.ipset.set_members(sg_id, ethertype,
+                                   sg_members.get(ethertype, []))
+
+    def _apply(self):
+        self.iptables.apply()
+        if not self._defer_apply:
+            self._remove_unused_ipsets()
+
+    def _remove_unused_ipsets(self):
+        if not self.enable_ipset:
+            return
+        for name in set(self.ipset.ipsets) - self._used_ipsets:
+            self.ipset.destroy(name)
+
     def prepare_port_filter(self, port):
         LOG.debug(_("Preparing device (%s) filter"), port['device'])
         self._remove_chains()
         self.filtered_ports[port['device']] = port
         # each security group has it own chains
         self._setup_chains()
-        self.iptables.apply()
+        self._apply()
 
     def update_port_filter(self, port):
         LOG.debug(_("Updating device (%s) filter"), port['device'])
@@ -71,7 +105,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self._remove_chains()
         self.filtered_ports[port['device']] = port
         self._setup_chains()
-        self.iptables.apply()
+        self._apply()
 
     def remove_port_filter(self, port):
         LOG.debug(_("Removing device (%s) filter"), port['device'])
@@ -82,7 +116,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self._remove_chains()
         self.filtered_ports.pop(port['device'], None)
         self._setup_chains()
-        self.iptables.apply()
+        self._apply()
 
     def _setup_chains(self):
         """Setup ingress and egress chain for a port."""
@@ -90,6 +124,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             self._setup_chains_apply(self.filtered_ports)
 
     def _setup_chains_apply(self, ports):
+        self._used_ipsets = set()
         self._add_chain_by_name_v4v6(SG_CHAIN)
         for port in ports.values():
             self._setup_chain(port, INGRESS_DIRECTION)
@@ -260,27 +295,31 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                 ipv6_iptables_rule)
             ipv4_iptables_rule += self._drop_dhcp_rule()
         ipv4_iptables_rule += self._convert_sgr_to_iptables_rules(
-            ipv4_sg_rules)
+            ipv4_sg_rules, direction)
         ipv6_iptables_rule += self._convert_sgr_to_iptables_rules(
-            ipv6_sg_rules)
+            ipv6_sg_rules, direction)
         self._add_rule_to_chain_v4v6(chain_name,
                                      ipv4_iptables_rule,
                                      ipv6_iptables_rule)
 
-    def _convert_sgr_to_iptables_rules(self, security_group_rules):
+    def _convert_sgr_to_iptables_rules(self, security_group_rules,
+                                       direction=INGRESS_DIRECTION):
         iptables_rules = []
         self._drop_invalid_packets(iptables_rules)
         self._allow_established(iptables_rules)
         for rule in security_group_rules:
             # These arguments MUST be in the format iptables-save will
-            # display them: source/dest, protocol, sport, dport, target
+            # display them: source/dest, protocol, set, sport, dport, target
             # Otherwise the iptables_manager code won't be able to find
             # them to preserve their [packet:byte] counts.
             args = self._ip_prefix_arg('s',
                                        rule.get('source_ip_prefix'))
             args += self._ip_prefix_arg('d',
                                         rule.get('dest_ip_prefix'))
-            args += self._protocol_arg(rule.get('protocol'))
+            protocol_args = self._protocol_arg(rule.get('protocol'))
+            args += protocol_args[:2]
+            args += self._remote_group_arg(direction, rule)
+            args += protocol_args[2:]
             args += self._port_arg('sport',
                                    rule.get('protocol'),
                                    rule.get('source_port_range_min'),
@@ -327,6 +366,19 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                     '--%ss' % direction,
                     '%s:%s' % (port_range_min, port_range_max)]
 
+    def _remote_group_arg(self, direction, rule):
+        # The server only sends rules with a remote_group_id, instead of
+        # one rule per member address, when ipset is enabled.
+        remote_group_id = rule.get('remote_group_id')
+        if not (self.enable_ipset and remote_group_id):
+            return []
+        name = ipset_manager.get_name(remote_group_id, rule['ethertype'])
+        if name not in self.ipset.ipsets:
+            # No members were reported for the group
+            self.ipset.set_members(remote_group_id, rule['ethertype'], [])
+        self._used_ipsets.add(name)
+        return ['-m set --match-set', name, IPSET_DIRECTION[direction]]
+
     def _ip_prefix_arg(self, direction, ip_prefix):
         #NOTE (nati) : source_group_id is converted to list of source_
         # ip_prefix in server side
@@ -351,6 +403,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             self._pre_defer_filtered_ports = None
             self._setup_chains_apply(self.filtered_ports)
             self.iptables.defer_apply_off()
+            self._remove_unused_ipsets()
 
 
 class OVSHybridIptablesFirewallDriver(IptablesFirewallDriver):
@@ -24,12 +24,24 @@
 import inspect
 import os
 
+from oslo.config import cfg
+
 from neutron.agent.linux import utils as linux_utils
 from neutron.common import utils
 from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+OPTS = [
+    cfg.BoolOpt('iptables_incremental_apply', default=False,
+                help=_("Only rewrite the wrapped iptables chains that changed "
+                       "since the last apply, using iptables-restore "
+                       "--noflush, instead of rewriting whole tables. Packet "
+                       "and byte counters of rewritten chains are reset.")),
+]
+
+cfg.CONF.register_opts(OPTS, 'AGENT')
+
 
 # NOTE(vish): Iptables supports chain names of up to 28 characters,  and we
 #             add up to 12 characters to binary_name which is used as a prefix,
@@ -268,6 +280,10 @@ class IptablesManager(object):
         self.namespace = namespace
         self.iptables_apply_deferred = False
         self.wrap_name = binary_name[:16]
+        self.incremental = cfg.CONF.AGENT.iptables_incremental_apply
+        # The last state applied for each command, used to compute the
+        # changes to apply in incremental mode
+        self._applied_state = {}
 
         self.ipv4 = {'filter': IptablesTable(binary_name=self.wrap_name)}
         self.ipv6 = {'filter': IptablesTable(binary_name=self.wrap_name)}
@@ -350,29 +366,173 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        In incremental mode, only the wrapped chains that changed since
+        the last apply are rewritten. Any other change, or any failure to
+        apply or verify the changes, results in a full apply.
+
         """
         s = [('iptables', self.ipv4)]
         if self.use_ipv6:
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
-            args = ['%s-save' % (cmd,), '-c']
-            if self.namespace:
-                args = ['ip', 'netns', 'exec', self.namespace] + args
-            all_tables = self.execute(args, root_helper=self.root_helper)
-            all_lines = all_tables.split('\n')
-            for table_name, table in tables.iteritems():
-                start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                    all_lines[start:end], table, table_name)
-
-            args = ['%s-restore' % (cmd,), '-c']
-            if self.namespace:
-                args = ['ip', 'netns', 'exec', self.namespace] + args
-            self.execute(args, process_input='\n'.join(all_lines),
-                         root_helper=self.root_helper)
+            state = self._get_state(tables)
+            if self.incremental and self._apply_incremental(cmd, tables,
+                                                            state):
+                continue
+            # Forget the applied state in case the full apply fails
+            self._applied_state.pop(cmd, None)
+            self._apply_full(cmd, tables)
+            self._applied_state[cmd] = state
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
+    def _execute_cmd(self, args, process_input=None):
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        if process_input is None:
+            return self.execute(args, root_helper=self.root_helper)
+        return self.execute(args, process_input=process_input,
+                            root_helper=self.root_helper)
+
+    def _apply_full(self, cmd, tables):
+        all_tables = self._execute_cmd(['%s-save' % (cmd,), '-c'])
+        all_lines = all_tables.split('\n')
+        for table_name, table in tables.iteritems():
+            start, end = self._find_table(all_lines, table_name)
+            all_lines[start:end] = self._modify_rules(
+                all_lines[start:end], table, table_name)
+
+        self._execute_cmd(['%s-restore' % (cmd,), '-c'],
+                          process_input='\n'.join(all_lines))
+
+    def _get_state(self, tables):
+        """Return a snapshot of the rules of the given tables.
+
+        The snapshot maps each table name to a tuple of the state of its
+        unwrapped chains and rules, and of a dict mapping each wrapped chain
+        to the rules it contains, in the order they are applied.
+        """
+        state = {}
+        for table_name, table in tables.iteritems():
+            wrapped = dict(('%s-%s' % (self.wrap_name, name), [])
+                           for name in table.chains)
+            unwrapped = []
+            for rule in ([r for r in table.rules if r.top] +
+                         [r for r in table.rules if not r.top]):
+                if rule.wrap:
+                    wrapped['%s-%s' % (self.wrap_name, rule.chain)].append(
+                        str(rule))
+                else:
+                    unwrapped.append((str(rule), rule.top))
+            for chain, rules in wrapped.iteritems():
+                # Duplicate rules are applied once, at their last position
+                seen = set()
+                deduped = []
+                for rule in reversed(rules):
+                    if rule not in seen:
+                        seen.add(rule)
+                        deduped.append(rule)
+                deduped.reverse()
+                wrapped[chain] = tuple(deduped)
+            state[table_name] = ((frozenset(table.unwrapped_chains),
+                                  tuple(unwrapped)),
+                                 wrapped)
+        return state
+
+    def _get_changed_chains(self, tables, old_state, new_state):
+        """Return the wrapped chains to rewrite for each table.
+
+        :returns: a dict mapping each table name to a dict mapping the
+                  changed chains to their new rules, or None for removed
+                  chains. None is returned if the changes cannot be applied
+                  incrementally.
+        """
+        if set(old_state) != set(new_state):
+            return
+        changes = {}
+        for table_name, (unwrapped, wrapped) in new_state.iteritems():
+            table = tables[table_name]
+            old_unwrapped, old_wrapped = old_state[table_name]
+            if (unwrapped != old_unwrapped or table.remove_rules or
+                    table.remove_chains):
+                return
+            changed = {}
+            for chain, rules in wrapped.iteritems():
+                if old_wrapped.get(chain) != rules:
+                    changed[chain] = rules
+            for chain in old_wrapped:
+                if chain not in wrapped:
+                    changed[chain] = None
+            if changed:
+                changes[table_name] = changed
+        return changes
+
+    def _apply_incremental(self, cmd, tables, state):
+        """Apply the changes made since the last apply.
+
+        :returns: True if the changes were applied, False if a full apply
+                  is required.
+        """
+        if cmd not in self._applied_state:
+            return False
+        changes = self._get_changed_chains(tables, self._applied_state[cmd],
+                                           state)
+        if changes is None:
+            return False
+        if changes:
+            lines = []
+            for table_name, changed in changes.iteritems():
+                lines.append('*%s' % table_name)
+                # In --noflush mode, declaring an existing user-defined
+                # chain flushes it.
+                lines += [':%s - [0:0]' % chain
+                          for chain, rules in changed.iteritems()]
+                for rules in changed.itervalues():
+                    lines += rules or []
+                # Removed chains are deleted once all of their rules, and
+                # the rules jumping to them, are gone.
+                lines += ['-X %s' % chain
+                          for chain, rules in changed.iteritems()
+                          if rules is None]
+                lines.append('COMMIT')
+            try:
+                self._execute_cmd(['%s-restore' % (cmd,), '--noflush'],
+                                  process_input='\n'.join(lines) + '\n')
+            except RuntimeError:
+                LOG.warn(_('Incremental %s-restore failed, falling back to '
+                           'a full apply'), cmd)
+                return False
+            for table_name, changed in changes.iteritems():
+                if not self._verify_chains(cmd, table_name, changed):
+                    LOG.warn(_('Verification of the %(cmd)s %(table)s table '
+                               'failed, falling back to a full apply'),
+                             {'cmd': cmd, 'table': table_name})
+                    return False
+        self._applied_state[cmd] = state
+        return True
+
+    def _verify_chains(self, cmd, table_name, changed):
+        """Check that changed chains hold the expected number of rules."""
+        try:
+            current = self._execute_cmd(['%s-save' % (cmd,), '-t',
+                                         table_name])
+        except RuntimeError:
+            return False
+        counts = {}
+        for line in current.split('\n'):
+            if line.startswith(':'):
+                counts.setdefault(line[1:].split(' ', 1)[0], 0)
+            elif line.startswith('-A '):
+                chain = line.split(' ', 2)[1]
+                counts[chain] = counts.get(chain, 0) + 1
+        for chain, rules in changed.iteritems():
+            if rules is None:
+                if chain in counts:
+                    return False
+            elif counts.get(chain) != len(rules):
+                return False
+        return True
+
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
             # length only <2 when fake iptables
@@ -305,6 +305,35 @@ class OVSBridge:
             LOG.info(_("Unable to parse regex results. Exception: %s"), e)
             return
 
+    def get_vifs_by_ids(self, port_ids):
+        """Return a dict of the VifPorts on this bridge keyed by iface-id.
+
+        A single dump of the Interface table is used for all of port_ids;
+        ids without a VIF port on this bridge are left out of the result.
+        """
+        vifs = {}
+        port_names = set(self.get_port_name_list())
+        args = ['--format=json', '--', '--columns=name,external_ids,ofport',
+                'list', 'Interface']
+        result = self.run_vsctl(args)
+        if not result:
+            return vifs
+        port_ids = set(port_ids)
+        for name, external_ids, ofport in jsonutils.loads(result)['data']:
+            if name not in port_names:
+                continue
+            external_ids = dict(external_ids[1])
+            vif_id = external_ids.get('iface-id')
+            if vif_id not in port_ids or 'attached-mac' not in external_ids:
+                continue
+            # An ofport that is not assigned yet is dumped as an empty set
+            if not isinstance(ofport, int):
+                LOG.info(_("Port %s has no ofport assigned"), name)
+                continue
+            vifs[vif_id] = VifPort(name, ofport, vif_id,
+                                   external_ids['attached-mac'], self)
+        return vifs
+
     def delete_ports(self, all_ports=False):
         if all_ports:
             port_names = self.get_port_name_list()
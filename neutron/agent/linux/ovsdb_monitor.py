@@ -0,0 +1,132 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.agent.linux import async_process
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class OvsdbMonitor(async_process.AsyncProcess):
+    """Manages an invocation of 'ovsdb-client monitor'."""
+
+    def __init__(self, table_name, columns=None, format=None,
+                 root_helper=None, respawn_interval=None):
+
+        cmd = ['ovsdb-client', 'monitor', table_name]
+        if columns:
+            cmd.append(','.join(columns))
+        if format:
+            cmd.append('--format=%s' % format)
+        super(OvsdbMonitor, self).__init__(cmd,
+                                           root_helper=root_helper,
+                                           respawn_interval=respawn_interval)
+
+    def _read_stderr(self):
+        data = super(OvsdbMonitor, self)._read_stderr()
+        if data:
+            for line in self.iter_stderr():
+                LOG.error(_('Error received from ovsdb monitor: %s'), line)
+        return data
+
+
+class SimpleInterfaceMonitor(OvsdbMonitor):
+    """Monitors the Interface table of the local host's ovsdb for changes.
+
+    The has_updates property indicates whether changes to the ovsdb
+    Interface table have been observed since the last invocation. Only
+    changes that add or remove an interface, or that change its ofport or
+    external_ids (and therefore its iface-id), are reported by
+    ovsdb-client, so an agent can use this to skip scanning its bridges
+    while nothing relevant has changed.
+    """
+
+    def __init__(self, root_helper=None, respawn_interval=None):
+        super(SimpleInterfaceMonitor, self).__init__(
+            'Interface',
+            columns=['name', 'ofport', 'external_ids'],
+            format='json',
+            root_helper=root_helper,
+            respawn_interval=respawn_interval,
+        )
+        self.data_received = False
+        self._pending_lines = []
+
+    @property
+    def is_active(self):
+        return self.data_received and self.is_running
+
+    @property
+    def has_updates(self):
+        """Indicate whether the ovsdb Interface table has been updated.
+
+        True will be returned if the monitor process is not active.
+        This 'failing open' minimizes the risk of falsely indicating
+        the absence of updates at the expense of potential false
+        positives.
+        """
+        changed = self.get_changed_interfaces()
+        return bool(changed) or not self.is_active
+
+    def get_changed_interfaces(self):
+        """Consume pending monitor output.
+
+        :returns: a set of names of the interfaces that were added, removed
+                  or modified since the last call.
+        """
+        lines = self._pending_lines + list(self.iter_stdout())
+        self._pending_lines = []
+        changed = set()
+        for line in lines:
+            changed |= self._parse_update(line)
+        return changed
+
+    def wait(self, timeout):
+        """Block until the monitor reports a change or timeout expires.
+
+        :returns: True if output is pending, False otherwise.
+        """
+        line = self.wait_for_stdout(timeout)
+        if line is None:
+            return False
+        self._pending_lines.append(line)
+        return True
+
+    def _parse_update(self, line):
+        try:
+            update = jsonutils.loads(line)
+            headings = update['headings']
+            name_idx = headings.index('name')
+            action_idx = headings.index('action')
+            rows = update['data']
+        except (ValueError, KeyError, TypeError):
+            LOG.warn(_('Unable to parse ovsdb monitor output: %s'), line)
+            # Treat anything unexpected as an update to be safe
+            return set([line])
+        self.data_received = True
+        changed = set()
+        for row in rows:
+            # 'old' rows describe the previous values of a modified row
+            # and are always followed by a matching 'new' row.
+            if row[action_idx] == 'old':
+                continue
+            LOG.debug(_('Interface %(name)s %(action)s'),
+                      {'name': row[name_idx], 'action': row[action_idx]})
+            changed.add(row[name_idx])
+        return changed
@@ -33,8 +33,12 @@ from neutron.openstack.common import log as logging
 LOG = logging.getLogger(__name__)
 
 
-def execute(cmd, root_helper=None, process_input=None, addl_env=None,
-            check_exit_code=True, return_stderr=False):
+def create_process(cmd, root_helper=None, addl_env=None):
+    """Create a process object for the given command.
+
+    The return value will be a tuple of the process object and the
+    list of command arguments used to create it.
+    """
     if root_helper:
         cmd = shlex.split(root_helper) + cmd
     cmd = map(str, cmd)
@@ -43,12 +47,21 @@ def execute(cmd, root_helper=None, process_input=None, addl_env=None,
     env = os.environ.copy()
     if addl_env:
         env.update(addl_env)
+
     obj = utils.subprocess_popen(cmd, shell=False,
                                  stdin=subprocess.PIPE,
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.PIPE,
                                  env=env)
 
+    return obj, cmd
+
+
+def execute(cmd, root_helper=None, process_input=None, addl_env=None,
+            check_exit_code=True, return_stderr=False):
+    obj, cmd = create_process(cmd, root_helper=root_helper,
+                              addl_env=addl_env)
+
     _stdout, _stderr = (process_input and
                         obj.communicate(process_input) or
                         obj.communicate())
@@ -63,6 +76,19 @@ def execute(cmd, root_helper=None, process_input=None, addl_env=None,
     return return_stderr and (_stdout, _stderr) or _stdout
 
 
+def find_child_pids(pid):
+    """Retrieve a list of the pids of child processes of the given pid."""
+
+    try:
+        raw_pids = execute(['ps', '--ppid', pid, '-o', 'pid='])
+    except RuntimeError as e:
+        # ps returns 1 when no processes match
+        if 'Exit code: 1' in str(e):
+            return []
+        raise
+    return [x.strip() for x in raw_pids.split('\n') if x.strip()]
+
+
 def get_interface_mac(interface):
     DEVICE_NAME_LEN = 15
     MAC_START = 18
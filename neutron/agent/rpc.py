@@ -19,6 +19,7 @@ from neutron.common import topics
 
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import rpc
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.openstack.common.rpc import proxy
 from neutron.openstack.common import timeutils
 
@@ -68,6 +69,7 @@ class PluginApi(proxy.RpcProxy):
 
     API version history:
         1.0 - Initial version.
+        1.2 - Add get_devices_details_list and update_devices_down_list.
 
     '''
 
@@ -77,18 +79,39 @@ class PluginApi(proxy.RpcProxy):
         super(PluginApi, self).__init__(
             topic=topic, default_version=self.BASE_RPC_API_VERSION)
 
+    def _call_list(self, context, method, devices, agent_id, fallback):
+        try:
+            return self.call(context,
+                             self.make_msg(method, devices=devices,
+                                           agent_id=agent_id),
+                             topic=self.topic, version='1.2')
+        except rpc_common.RemoteError as e:
+            if e.exc_type != 'UnsupportedRpcVersion':
+                raise
+        LOG.debug(_("Plugin does not support %s, falling back to one call "
+                    "per device"), method)
+        return [fallback(context, device, agent_id) for device in devices]
+
     def get_device_details(self, context, device, agent_id):
         return self.call(context,
                          self.make_msg('get_device_details', device=device,
                                        agent_id=agent_id),
                          topic=self.topic)
 
+    def get_devices_details_list(self, context, devices, agent_id):
+        return self._call_list(context, 'get_devices_details_list',
+                               devices, agent_id, self.get_device_details)
+
     def update_device_down(self, context, device, agent_id):
         return self.call(context,
                          self.make_msg('update_device_down', device=device,
                                        agent_id=agent_id),
                          topic=self.topic)
 
+    def update_devices_down_list(self, context, devices, agent_id):
+        return self._call_list(context, 'update_devices_down_list',
+                               devices, agent_id, self.update_device_down)
+
     def update_device_up(self, context, device, agent_id):
         return self.call(context,
                          self.make_msg('update_device_up', device=device,
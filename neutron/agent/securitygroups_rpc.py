@@ -16,20 +16,30 @@
 #    under the License.
 #
 
+import netaddr
 from oslo.config import cfg
 
 from neutron.common import topics
 from neutron.openstack.common import importutils
 from neutron.openstack.common import log as logging
+from neutron.openstack.common.rpc import common as rpc_common
 
 LOG = logging.getLogger(__name__)
 SG_RPC_VERSION = "1.1"
 
+DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
+                       'egress': 'dest_ip_prefix'}
+
 security_group_opts = [
     cfg.StrOpt(
         'firewall_driver',
         default='neutron.agent.firewall.NoopFirewallDriver',
-        help=_('Driver for Security Groups Firewall'))
+        help=_('Driver for Security Groups Firewall')),
+    cfg.BoolOpt(
+        'enable_ipset',
+        default=False,
+        help=_('Use ipset to match the members of remote security groups '
+               'instead of one iptables rule per member address'))
 ]
 cfg.CONF.register_opts(security_group_opts, 'SECURITYGROUP')
 
@@ -39,6 +49,10 @@ def is_firewall_enabled():
             'neutron.agent.firewall.NoopFirewallDriver')
 
 
+def is_ipset_enabled():
+    return is_firewall_enabled() and cfg.CONF.SECURITYGROUP.enable_ipset
+
+
 def disable_security_group_extension_if_noop_driver(
     supported_extension_aliases):
     if not is_firewall_enabled():
@@ -57,6 +71,37 @@ class SecurityGroupServerRpcApiMixin(object):
                          version=SG_RPC_VERSION,
                          topic=self.topic)
 
+    def security_group_info_for_devices(self, context, devices):
+        """Get security group rules and members for devices.
+
+        Unlike security_group_rules_for_devices, rules with a remote group
+        are not expanded into one rule per member address. The member
+        addresses of the remote groups are returned separately.
+        """
+        LOG.debug(_("Get security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_devices',
+                                       devices=devices),
+                         version='1.3',
+                         topic=self.topic)
+
+    def security_group_compact_info_for_devices(self, context, devices):
+        """Get security group information for devices, compactly.
+
+        The rules of each security group and the members of each remote
+        group are returned once, keyed by group id, and ports reference
+        their groups by id.
+        """
+        LOG.debug(_("Get compact security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg(
+                             'security_group_compact_info_for_devices',
+                             devices=devices),
+                         version='1.4',
+                         topic=self.topic)
+
 
 class SecurityGroupAgentRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent
@@ -96,17 +141,99 @@ class SecurityGroupAgentRpcMixin(object):
     support in agent implementations.
     """
 
+    use_ipset = False
+    # Agents whose plugins support security_group_compact_info_for_devices
+    # set this to avoid receiving the rules of shared groups once per port
+    use_compact_rpc = False
+
     def init_firewall(self):
         firewall_driver = cfg.CONF.SECURITYGROUP.firewall_driver
         LOG.debug(_("Init firewall settings (driver=%s)"), firewall_driver)
         self.firewall = importutils.import_object(firewall_driver)
+        # Fetch remote group members separately from the rules when the
+        # firewall matches them with ipsets
+        self.use_ipset = is_ipset_enabled()
+
+    def _get_devices_info(self, device_ids):
+        """Return the port dicts with the security group rules of devices.
+
+        When ipset is used, the members of the remote groups of the devices
+        are also passed to the firewall. If the plugin does not support
+        that, rules are fetched with one rule per member address instead.
+        """
+        if self.use_compact_rpc:
+            try:
+                info = self.plugin_rpc.security_group_compact_info_for_devices(
+                    self.context, list(device_ids))
+            except rpc_common.RemoteError as e:
+                if e.exc_type != 'UnsupportedRpcVersion':
+                    raise
+                LOG.warn(_("Compact security group information is not "
+                           "supported by the plugin"))
+                self.use_compact_rpc = False
+            else:
+                return self._expand_compact_info(info)
+        if self.use_ipset:
+            try:
+                info = self.plugin_rpc.security_group_info_for_devices(
+                    self.context, list(device_ids))
+            except rpc_common.RemoteError as e:
+                if e.exc_type != 'UnsupportedRpcVersion':
+                    raise
+                LOG.warn(_("Security group member information is not "
+                           "supported by the plugin, ipset will not be "
+                           "used"))
+                self.use_ipset = False
+            else:
+                for sg_id, sg_members in info['sg_member_ips'].iteritems():
+                    self.firewall.update_security_group_members(sg_id,
+                                                                sg_members)
+                return info['devices']
+        return self.plugin_rpc.security_group_rules_for_devices(
+            self.context, list(device_ids))
+
+    def _expand_compact_info(self, info):
+        """Build the rules of each device from compact information."""
+        sg_member_ips = info['sg_member_ips']
+        if self.use_ipset:
+            for sg_id, sg_members in sg_member_ips.iteritems():
+                self.firewall.update_security_group_members(sg_id,
+                                                            sg_members)
+        devices = info['devices']
+        for device in devices.values():
+            rules = []
+            for sg_id in device.get('security_groups', []):
+                for rule in info['security_groups'].get(sg_id, []):
+                    remote_group_id = rule.get('remote_group_id')
+                    if self.use_ipset or not remote_group_id:
+                        rules.append(rule)
+                        continue
+                    rules += self._expand_remote_group_rule(
+                        device, rule, sg_member_ips.get(remote_group_id, {}))
+            # Provider rules come after the security group rules
+            device['security_group_rules'] = (
+                rules + device['security_group_rules'])
+        return devices
+
+    def _expand_remote_group_rule(self, device, rule, sg_members):
+        """Convert a remote group rule into one rule per member address."""
+        own_ips = set(str(netaddr.IPNetwork(ip).cidr)
+                      for ip in device.get('fixed_ips', []))
+        direction_ip_prefix = DIRECTION_IP_PREFIX[rule['direction']]
+        rules = []
+        for ip in sg_members.get(rule['ethertype'], []):
+            if ip in own_ips:
+                continue
+            ip_rule = rule.copy()
+            ip_rule[direction_ip_prefix] = ip
+            rules.append(ip_rule)
+        return rules
 
     def prepare_devices_filter(self, device_ids):
         if not device_ids:
             return
         LOG.info(_("Preparing filters for devices %s"), device_ids)
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, list(device_ids))
+        devices = self._get_devices_info(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
                 self.firewall.prepare_port_filter(device)
@@ -121,20 +248,49 @@ class SecurityGroupAgentRpcMixin(object):
     def security_groups_member_updated(self, security_groups):
         LOG.info(_("Security group "
                    "member updated %r"), security_groups)
+        if self.use_ipset:
+            self._security_group_members_updated(security_groups)
+            return
         self._security_group_updated(
             security_groups,
             'security_group_source_groups')
 
-    def _security_group_updated(self, security_groups, attribute):
-        devices = []
+    def _select_devices(self, security_groups, attribute):
         sec_grp_set = set(security_groups)
-        for device in self.firewall.ports.values():
-            if sec_grp_set & set(device.get(attribute, [])):
-                devices.append(device)
+        return [device for device in self.firewall.ports.values()
+                if sec_grp_set & set(device.get(attribute, []))]
 
+    def _security_group_updated(self, security_groups, attribute):
+        devices = self._select_devices(security_groups, attribute)
         if devices:
             self.refresh_firewall(devices)
 
+    def _security_group_members_updated(self, security_groups):
+        """Only update the ipsets of the groups whose members changed."""
+        devices = self._select_devices(security_groups,
+                                       'security_group_source_groups')
+        if not devices:
+            return
+        # Any of the devices is enough for the plugin to return the members
+        # of the groups, but ask for all of them in case one was deleted
+        device_ids = [d['device'] for d in devices]
+        if self.use_compact_rpc:
+            get_info = self.plugin_rpc.security_group_compact_info_for_devices
+        else:
+            get_info = self.plugin_rpc.security_group_info_for_devices
+        try:
+            info = get_info(self.context, device_ids)
+        except rpc_common.RemoteError:
+            LOG.exception(_("Unable to get security group members, "
+                            "refreshing the firewall instead"))
+            self.refresh_firewall(devices)
+            return
+        for sg_id in security_groups:
+            sg_members = info['sg_member_ips'].get(sg_id)
+            if sg_members is not None:
+                self.firewall.update_security_group_members(sg_id,
+                                                            sg_members)
+
     def security_groups_provider_updated(self):
         LOG.info(_("Provider rule updated"))
         self.refresh_firewall()
@@ -160,8 +316,7 @@ class SecurityGroupAgentRpcMixin(object):
         if not device_ids:
             LOG.info(_("No ports here to refresh firewall"))
             return
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, device_ids)
+        devices = self._get_devices_info(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
                 LOG.debug(_("Update port filter for %s"), device['device'])
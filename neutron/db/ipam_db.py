@@ -0,0 +1,452 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import netaddr
+from oslo.config import cfg
+import sqlalchemy as sa
+from sqlalchemy import orm
+from sqlalchemy.orm import exc
+
+from neutron.common import exceptions as q_exc
+from neutron.db import model_base
+from neutron.db import models_v2
+from neutron.openstack.common import importutils
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+ipam_opts = [
+    cfg.StrOpt('ipam_driver',
+               default='neutron.db.ipam_db.RangeIpamDriver',
+               help=_("The driver used to track available IP addresses in "
+                      "subnet allocation pools. Pools handled by "
+                      "neutron.db.ipam_db.BitmapIpamDriver are not converted "
+                      "back to availability ranges")),
+]
+cfg.CONF.register_opts(ipam_opts)
+
+# Pools larger than this (in addresses) are always tracked with
+# availability ranges; 2 ** 24 addresses make a 2MB bitmap.
+MAX_BITMAP_SIZE = 2 ** 24
+
+_drivers = {}
+
+
+def get_driver():
+    """Return the IPAM driver instance configured by ipam_driver."""
+    driver_class = cfg.CONF.ipam_driver
+    if driver_class not in _drivers:
+        LOG.info(_("Loading IPAM driver %s"), driver_class)
+        _drivers[driver_class] = importutils.import_object(driver_class)
+    return _drivers[driver_class]
+
+
+class IPAvailabilityBitmap(model_base.BASEV2):
+    """Internal representation of the allocated IPs of an allocation pool.
+
+    Bit N of the bitmap (least significant bit of each byte first) is set
+    when the N-th address of the pool is allocated. Padding bits past the
+    end of the pool are always set. Rows are never locked on the fast
+    path: writers compare-and-swap on the version column instead.
+    """
+
+    allocation_pool_id = sa.Column(sa.String(36),
+                                   sa.ForeignKey('ipallocationpools.id',
+                                                 ondelete="CASCADE"),
+                                   nullable=False,
+                                   primary_key=True)
+    bitmap = sa.Column(sa.LargeBinary(MAX_BITMAP_SIZE // 8), nullable=False)
+    free_count = sa.Column(sa.Integer, nullable=False)
+    version = sa.Column(sa.Integer, nullable=False)
+    ipallocationpool = orm.relationship(
+        models_v2.IPAllocationPool,
+        backref=orm.backref('available_bitmap', uselist=False,
+                            cascade='delete'))
+
+
+def _new_bitmap(size):
+    """Return an empty bitmap for a pool of size addresses."""
+    bits = bytearray((size + 7) // 8)
+    for i in range(size, len(bits) * 8):
+        _set_bit(bits, i)
+    return bits
+
+
+def _set_bit(bits, index):
+    bits[index >> 3] |= 1 << (index & 7)
+
+
+def _clear_bit(bits, index):
+    bits[index >> 3] &= ~(1 << (index & 7)) & 0xff
+
+
+def _test_bit(bits, index):
+    return bool(bits[index >> 3] & (1 << (index & 7)))
+
+
+def _first_free(bits):
+    """Return the index of the first clear bit, or None if all are set."""
+    # lstrip runs in C, so skipping full bytes stays cheap on large pools
+    byte_index = len(bits) - len(bytes(bits).lstrip(b'\xff'))
+    if byte_index == len(bits):
+        return None
+    byte = bits[byte_index]
+    return byte_index * 8 + ((byte + 1) & ~byte).bit_length() - 1
+
+
+class RangeIpamDriver(object):
+    """Track available IPs as a list of ranges per allocation pool.
+
+    Allocation and recycling lock the IPAvailabilityRange rows of the
+    subnet with SELECT ... FOR UPDATE.
+    """
+
+    def create_pool(self, context, ip_pool):
+        """Set up availability tracking for a new allocation pool."""
+        ip_range = models_v2.IPAvailabilityRange(
+            ipallocationpool=ip_pool,
+            first_ip=ip_pool['first_ip'],
+            last_ip=ip_pool['last_ip'])
+        context.session.add(ip_range)
+
+    def generate_ip(self, context, subnets):
+        """Generate an IP address.
+
+        The IP address will be generated from one of the subnets defined on
+        the network.
+        """
+        for subnet in subnets:
+            ip_address = self._generate_ip_from_subnet(context, subnet)
+            if ip_address:
+                return {'ip_address': ip_address, 'subnet_id': subnet['id']}
+            LOG.debug(_("All IP's from subnet %(subnet_id)s (%(cidr)s) "
+                        "allocated"),
+                      {'subnet_id': subnet['id'], 'cidr': subnet['cidr']})
+        raise q_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+
+    def _generate_ip_from_subnet(self, context, subnet):
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).join(
+                models_v2.IPAllocationPool).with_lockmode('update')
+        range = range_qry.filter_by(subnet_id=subnet['id']).first()
+        if not range:
+            return
+        ip_address = range['first_ip']
+        LOG.debug(_("Allocated IP - %(ip_address)s from %(first_ip)s "
+                    "to %(last_ip)s"),
+                  {'ip_address': ip_address,
+                   'first_ip': range['first_ip'],
+                   'last_ip': range['last_ip']})
+        if range['first_ip'] == range['last_ip']:
+            # No more free indices on subnet => delete
+            LOG.debug(_("No more free IP's in slice. Deleting allocation "
+                        "pool."))
+            context.session.delete(range)
+        else:
+            # increment the first free
+            range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
+        return ip_address
+
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        """Allocate a specific IP address on the subnet."""
+        ip = int(netaddr.IPAddress(ip_address))
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).join(
+                models_v2.IPAllocationPool).with_lockmode('update')
+        results = range_qry.filter_by(subnet_id=subnet_id)
+        for range in results:
+            first = int(netaddr.IPAddress(range['first_ip']))
+            last = int(netaddr.IPAddress(range['last_ip']))
+            if first <= ip <= last:
+                if first == last:
+                    context.session.delete(range)
+                    return
+                elif first == ip:
+                    range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
+                    return
+                elif last == ip:
+                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
+                    return
+                else:
+                    # Split into two ranges
+                    new_first = str(netaddr.IPAddress(ip_address) + 1)
+                    new_last = range['last_ip']
+                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
+                    ip_range = models_v2.IPAvailabilityRange(
+                        allocation_pool_id=range['allocation_pool_id'],
+                        first_ip=new_first,
+                        last_ip=new_last)
+                    context.session.add(ip_range)
+                    return
+
+    def release_ip(self, context, subnet_id, ip_address):
+        """Return an IP address to the pool of free IP's of the subnet."""
+        # Grab all allocation pools for the subnet
+        allocation_pools = (context.session.query(
+            models_v2.IPAllocationPool).filter_by(subnet_id=subnet_id).
+            options(orm.joinedload('available_ranges', innerjoin=True)).
+            with_lockmode('update'))
+
+        # Find the allocation pool for the IP to recycle
+        pool_id = None
+        for allocation_pool in allocation_pools:
+            allocation_pool_range = netaddr.IPRange(
+                allocation_pool['first_ip'],
+                allocation_pool['last_ip'])
+            if netaddr.IPAddress(ip_address) in allocation_pool_range:
+                pool_id = allocation_pool['id']
+                break
+        if not pool_id:
+            return
+        self._release_ip_to_ranges(context, pool_id, ip_address)
+
+    def _release_ip_to_ranges(self, context, pool_id, ip_address):
+        # Two requests will be done on the database. The first will be to
+        # search if an entry starts with ip_address + 1 (r1). The second
+        # will be to see if an entry ends with ip_address -1 (r2).
+        # If 1 of the above holds true then the specific entry will be
+        # modified. If both hold true then the two ranges will be merged.
+        # If there are no entries then a single entry will be added.
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).with_lockmode('update')
+        ip_first = str(netaddr.IPAddress(ip_address) + 1)
+        ip_last = str(netaddr.IPAddress(ip_address) - 1)
+        LOG.debug(_("Recycle %s"), ip_address)
+        try:
+            r1 = range_qry.filter_by(allocation_pool_id=pool_id,
+                                     first_ip=ip_first).one()
+            LOG.debug(_("Recycle: first match for %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
+        except exc.NoResultFound:
+            r1 = []
+        try:
+            r2 = range_qry.filter_by(allocation_pool_id=pool_id,
+                                     last_ip=ip_last).one()
+            LOG.debug(_("Recycle: last match for %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
+        except exc.NoResultFound:
+            r2 = []
+
+        if r1 and r2:
+            # Merge the two ranges
+            ip_range = models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=r2['first_ip'],
+                last_ip=r1['last_ip'])
+            context.session.add(ip_range)
+            LOG.debug(_("Recycle: merged %(first_ip1)s-%(last_ip1)s and "
+                        "%(first_ip2)s-%(last_ip2)s"),
+                      {'first_ip1': r2['first_ip'], 'last_ip1': r2['last_ip'],
+                       'first_ip2': r1['first_ip'], 'last_ip2': r1['last_ip']})
+            context.session.delete(r1)
+            context.session.delete(r2)
+        elif r1:
+            # Update the range with matched first IP
+            r1['first_ip'] = ip_address
+            LOG.debug(_("Recycle: updated first %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
+        elif r2:
+            # Update the range with matched last IP
+            r2['last_ip'] = ip_address
+            LOG.debug(_("Recycle: updated last %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
+        else:
+            # Create a new range
+            ip_range = models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=ip_address,
+                last_ip=ip_address)
+            context.session.add(ip_range)
+            LOG.debug(_("Recycle: created new %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': ip_address, 'last_ip': ip_address})
+
+
+class BitmapIpamDriver(RangeIpamDriver):
+    """Track allocated IPs as one bitmap row per allocation pool.
+
+    The pool rows are read without locks and written back with an
+    UPDATE ... WHERE version = <version read>. If another transaction
+    updated the pool in between, the row is re-read with a lock so the
+    retry is guaranteed to make progress, which on databases with
+    snapshot reads a plain re-read would not.
+
+    Pools created before switching to this driver get their bitmap built
+    from the IP allocation table the first time they are used. Pools
+    larger than MAX_BITMAP_SIZE keep using availability ranges.
+    """
+
+    def create_pool(self, context, ip_pool):
+        size = self._pool_size(ip_pool)
+        if size > MAX_BITMAP_SIZE:
+            return super(BitmapIpamDriver, self).create_pool(context, ip_pool)
+        context.session.add(IPAvailabilityBitmap(
+            ipallocationpool=ip_pool,
+            bitmap=bytes(_new_bitmap(size)),
+            free_count=size,
+            version=0))
+
+    @staticmethod
+    def _pool_size(pool):
+        return (int(netaddr.IPAddress(pool.last_ip)) -
+                int(netaddr.IPAddress(pool.first_ip)) + 1)
+
+    def _get_bitmap_pools(self, context, subnet_id):
+        """Return (id, first_ip, last_ip, free_count) of the bitmap pools.
+
+        Bitmaps are built for pools of the subnet which do not have one
+        yet. The bitmaps themselves are not loaded.
+        """
+        Pool = models_v2.IPAllocationPool
+        Bitmap = IPAvailabilityBitmap
+        query = context.session.query(
+            Pool.id, Pool.first_ip, Pool.last_ip, Bitmap.free_count).outerjoin(
+                Bitmap, Bitmap.allocation_pool_id == Pool.id).filter(
+                    Pool.subnet_id == subnet_id)
+        pools = []
+        for pool in query:
+            if pool.free_count is not None:
+                pools.append(pool)
+            elif self._pool_size(pool) <= MAX_BITMAP_SIZE:
+                free_count = self._build_bitmap(context, subnet_id, pool)
+                pools.append((pool.id, pool.first_ip, pool.last_ip,
+                              free_count))
+        return pools
+
+    def _build_bitmap(self, context, subnet_id, pool):
+        """Build the bitmap of a pool from the IP allocation table."""
+        first = int(netaddr.IPAddress(pool.first_ip))
+        size = self._pool_size(pool)
+        bits = _new_bitmap(size)
+        free_count = size
+        allocated = context.session.query(
+            models_v2.IPAllocation.ip_address).filter_by(subnet_id=subnet_id)
+        for allocation in allocated:
+            index = int(netaddr.IPAddress(allocation.ip_address)) - first
+            if 0 <= index < size and not _test_bit(bits, index):
+                _set_bit(bits, index)
+                free_count -= 1
+        LOG.debug(_("Built IP availability bitmap for allocation pool "
+                    "%(pool_id)s: %(free)s of %(size)s addresses free"),
+                  {'pool_id': pool.id, 'free': free_count, 'size': size})
+        # The ranges are superseded by the bitmap
+        context.session.query(models_v2.IPAvailabilityRange).filter_by(
+            allocation_pool_id=pool.id).delete()
+        context.session.add(IPAvailabilityBitmap(
+            allocation_pool_id=pool.id,
+            bitmap=bytes(bits),
+            free_count=free_count,
+            version=0))
+        context.session.flush()
+        return free_count
+
+    @staticmethod
+    def _update_bitmap(context, pool_id, update, lock=False):
+        """Apply update to the bitmap of the pool with compare-and-swap.
+
+        update is called with the bitmap as a bytearray and returns the
+        change in the number of free addresses, or None to leave the row
+        untouched. Returns the result of the last call to update.
+        """
+        Bitmap = IPAvailabilityBitmap
+        while True:
+            query = context.session.query(
+                Bitmap.bitmap, Bitmap.free_count, Bitmap.version).filter_by(
+                    allocation_pool_id=pool_id)
+            if lock:
+                query = query.with_lockmode('update')
+            row = query.one()
+            bits = bytearray(row.bitmap)
+            delta = update(bits)
+            if delta is None:
+                return
+            swapped = context.session.query(Bitmap).filter_by(
+                allocation_pool_id=pool_id, version=row.version).update(
+                    {'bitmap': bytes(bits),
+                     'free_count': row.free_count + delta,
+                     'version': row.version + 1},
+                    synchronize_session=False)
+            if swapped:
+                return delta
+            LOG.debug(_("Concurrent update of the IP availability bitmap "
+                        "of allocation pool %s, retrying"), pool_id)
+            lock = True
+
+    def _generate_ip_from_subnet(self, context, subnet):
+        for pool_id, first_ip, last_ip, free_count in self._get_bitmap_pools(
+                context, subnet['id']):
+            if not free_count:
+                continue
+            allocated = []
+
+            def _allocate(bits):
+                index = _first_free(bits)
+                if index is None:
+                    return
+                _set_bit(bits, index)
+                allocated[:] = [index]
+                return -1
+
+            if self._update_bitmap(context, pool_id, _allocate):
+                ip_address = str(netaddr.IPAddress(first_ip) + allocated[0])
+                LOG.debug(_("Allocated IP - %(ip_address)s from %(first_ip)s "
+                            "to %(last_ip)s"),
+                          {'ip_address': ip_address,
+                           'first_ip': first_ip,
+                           'last_ip': last_ip})
+                return ip_address
+        return super(BitmapIpamDriver, self)._generate_ip_from_subnet(
+            context, subnet)
+
+    def _find_bitmap_pool(self, context, subnet_id, ip_address):
+        """Return (pool_id, index) of the address, or (None, None)."""
+        ip = int(netaddr.IPAddress(ip_address))
+        for pool_id, first_ip, last_ip, free_count in self._get_bitmap_pools(
+                context, subnet_id):
+            first = int(netaddr.IPAddress(first_ip))
+            if first <= ip <= int(netaddr.IPAddress(last_ip)):
+                return pool_id, ip - first
+        return None, None
+
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        pool_id, index = self._find_bitmap_pool(context, subnet_id,
+                                                ip_address)
+        if pool_id is None:
+            return super(BitmapIpamDriver, self).allocate_specific_ip(
+                context, subnet_id, ip_address)
+
+        def _allocate(bits):
+            if not _test_bit(bits, index):
+                _set_bit(bits, index)
+                return -1
+
+        self._update_bitmap(context, pool_id, _allocate)
+
+    def release_ip(self, context, subnet_id, ip_address):
+        pool_id, index = self._find_bitmap_pool(context, subnet_id,
+                                                ip_address)
+        if pool_id is None:
+            return super(BitmapIpamDriver, self).release_ip(
+                context, subnet_id, ip_address)
+
+        def _release(bits):
+            if _test_bit(bits, index):
+                _clear_bit(bits, index)
+                return 1
+
+        LOG.debug(_("Recycle %s"), ip_address)
+        self._update_bitmap(context, pool_id, _release)
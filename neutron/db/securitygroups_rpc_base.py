@@ -21,6 +21,7 @@ from neutron.common import constants as q_const
 from neutron.common import utils
 from neutron.db import models_v2
 from neutron.db import securitygroups_db as sg_db
+from neutron.extensions import allowedaddresspairs as addr_pair
 from neutron.extensions import securitygroup as ext_sg
 from neutron.openstack.common import log as logging
 
@@ -35,6 +36,68 @@ DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
                        'egress': 'dest_ip_prefix'}
 
 
+class SecurityGroupInfoCache(object):
+    """Cache of the security group information sent to agents.
+
+    Holds the rules of security groups, the member addresses of remote
+    groups and the DHCP addresses of networks. Entries are invalidated by
+    the plugin when it notifies the agents of a change. Every invalidation
+    bumps a generation number, so that a lookup which raced with an
+    invalidation does not store its possibly stale result.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self.rules = {}
+        self.member_ips = {}
+        self.dhcp_ips = {}
+
+    def get(self, cache, keys, select):
+        """Return the cached entries of keys, selecting the missing ones.
+
+        :param cache: one of the rules, member_ips or dhcp_ips dicts
+        :param select: called with the list of missing keys, returns a
+                       dict of their entries
+        """
+        found = {}
+        missing = []
+        for key in keys:
+            if key in cache:
+                found[key] = cache[key]
+            else:
+                missing.append(key)
+        if missing:
+            generation = self.generation
+            selected = select(missing)
+            if generation == self.generation:
+                cache.update(selected)
+            found.update(selected)
+        return found
+
+    def _invalidate(self, cache, keys):
+        self.generation += 1
+        for key in keys:
+            cache.pop(key, None)
+
+    def invalidate_rules(self, security_group_ids):
+        self._invalidate(self.rules, security_group_ids)
+
+    def invalidate_member_ips(self, security_group_ids):
+        self._invalidate(self.member_ips, security_group_ids)
+
+    def invalidate_dhcp_ips(self, network_ids):
+        self._invalidate(self.dhcp_ips, network_ids)
+
+    def clear(self):
+        self.generation += 1
+        self.rules.clear()
+        self.member_ips.clear()
+        self.dhcp_ips.clear()
+
+
+sg_info_cache = SecurityGroupInfoCache()
+
+
 class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
 
     def create_security_group_rule(self, context, security_group_rule):
@@ -42,6 +105,7 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule = self.create_security_group_rule_bulk_native(context,
                                                            bulk_rule)[0]
         sgids = [rule['security_group_id']]
+        sg_info_cache.invalidate_rules(sgids)
         self.notifier.security_groups_rule_updated(context, sgids)
         return rule
 
@@ -51,6 +115,7 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
                       self).create_security_group_rule_bulk_native(
                           context, security_group_rule)
         sgids = set([r['security_group_id'] for r in rules])
+        sg_info_cache.invalidate_rules(sgids)
         self.notifier.security_groups_rule_updated(context, list(sgids))
         return rules
 
@@ -58,9 +123,16 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule = self.get_security_group_rule(context, sgrid)
         super(SecurityGroupServerRpcMixin,
               self).delete_security_group_rule(context, sgrid)
+        sg_info_cache.invalidate_rules([rule['security_group_id']])
         self.notifier.security_groups_rule_updated(context,
                                                    [rule['security_group_id']])
 
+    def delete_security_group(self, context, id):
+        super(SecurityGroupServerRpcMixin,
+              self).delete_security_group(context, id)
+        sg_info_cache.invalidate_rules([id])
+        sg_info_cache.invalidate_member_ips([id])
+
     def update_security_group_on_port(self, context, id, port,
                                       original_port, updated_port):
         """Update security groups on port.
@@ -94,6 +166,10 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         It is because another changes for the port may require notification.
         """
         need_notify = False
+        # The port may have left groups, or changed its address pairs
+        sg_info_cache.invalidate_member_ips(
+            set(original_port.get(ext_sg.SECURITYGROUPS) or []) |
+            set(updated_port.get(ext_sg.SECURITYGROUPS) or []))
         if (original_port['fixed_ips'] != updated_port['fixed_ips'] or
             not utils.compare_elements(
                 original_port.get(ext_sg.SECURITYGROUPS),
@@ -115,8 +191,11 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule in the other RPC call (security_group_rules_for_devices).
         """
         if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
+            sg_info_cache.invalidate_dhcp_ips([port['network_id']])
             self.notifier.security_groups_provider_updated(context)
         else:
+            sg_info_cache.invalidate_member_ips(
+                port.get(ext_sg.SECURITYGROUPS) or [])
             self.notifier.security_groups_member_updated(
                 context, port.get(ext_sg.SECURITYGROUPS))
 
@@ -136,7 +215,85 @@ class SecurityGroupServerRpcCallbackMixin(object):
         :returns: port correspond to the devices with security group rules
         """
         devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        return self._security_group_rules_for_ports(context, ports)
+
+    def security_group_info_for_devices(self, context, **kwargs):
+        """Return security group rules and remote group members.
+
+        Unlike security_group_rules_for_devices, rules with a
+        remote_group_id are returned as is, and the addresses of the
+        members of each remote group are returned once, keyed by group.
+
+        :params devices: list of devices
+        :returns: a dict with a 'devices' key mapping to the ports
+                  correspond to the devices with security group rules,
+                  and a 'sg_member_ips' key mapping each remote group id
+                  to a dict of member addresses by ethertype
+        """
+        devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        self._add_security_group_rules_to_ports(context, ports)
+        remote_group_ids = self._select_remote_group_ids(ports)
+        sg_member_ips = self._select_member_ips_for_remote_group(
+            context, remote_group_ids)
+        for port in ports.values():
+            for rule in port['security_group_rules']:
+                remote_group_id = rule.get('remote_group_id')
+                if remote_group_id:
+                    port['security_group_source_groups'].append(
+                        remote_group_id)
+        return {'devices': ports, 'sg_member_ips': sg_member_ips}
+
+    def security_group_compact_info_for_devices(self, context, **kwargs):
+        """Return security group information without repeating groups.
+
+        The rules of each security group, and the member addresses of
+        each remote group, are returned once keyed by group id instead of
+        being repeated for every port. Ports reference their groups by id
+        and only carry their own provider rules. Group information is
+        cached until the plugin notifies the agents of a change.
+
+        :params devices: list of devices
+        :returns: a dict with a 'devices' key mapping to the ports
+                  correspond to the devices with their provider rules,
+                  a 'security_groups' key mapping each of their groups to
+                  its rules and a 'sg_member_ips' key mapping each remote
+                  group id to a dict of member addresses by ethertype
+        """
+        devices = kwargs.get('devices')
+        ports = self._get_ports_for_devices(devices)
+        sg_ids = set()
+        for port in ports.values():
+            sg_ids.update(port.get(ext_sg.SECURITYGROUPS) or [])
+        security_groups = sg_info_cache.get(
+            sg_info_cache.rules, sg_ids,
+            lambda ids: self._select_rules_for_security_groups(context, ids))
+        remote_group_ids = set()
+        for port in ports.values():
+            port_remote_group_ids = set()
+            for sg_id in port.get(ext_sg.SECURITYGROUPS) or []:
+                for rule in security_groups[sg_id]:
+                    if rule.get('remote_group_id'):
+                        port_remote_group_ids.add(rule['remote_group_id'])
+            port['security_group_source_groups'] = list(
+                port_remote_group_ids)
+            remote_group_ids |= port_remote_group_ids
+        sg_member_ips = sg_info_cache.get(
+            sg_info_cache.member_ips, remote_group_ids,
+            lambda ids: self._select_member_ips_for_remote_group(context,
+                                                                 ids))
+        dhcp_ips = sg_info_cache.get(
+            sg_info_cache.dhcp_ips, self._select_network_ids(ports),
+            lambda ids: self._select_dhcp_ips_for_network_ids(context, ids))
+        for port in ports.values():
+            self._add_ingress_ra_rule(port, dhcp_ips)
+            self._add_ingress_dhcp_rule(port, dhcp_ips)
+        return {'devices': ports,
+                'security_groups': security_groups,
+                'sg_member_ips': sg_member_ips}
 
+    def _get_ports_for_devices(self, devices):
         ports = {}
         for device in devices:
             port = self.get_port_from_device(device)
@@ -145,7 +302,7 @@ class SecurityGroupServerRpcCallbackMixin(object):
             if port['device_owner'].startswith('network:'):
                 continue
             ports[port['id']] = port
-        return self._security_group_rules_for_ports(context, ports)
+        return ports
 
     def _select_rules_for_ports(self, context, ports):
         if not ports:
@@ -162,6 +319,32 @@ class SecurityGroupServerRpcCallbackMixin(object):
         query = query.filter(sg_binding_port.in_(ports.keys()))
         return query.all()
 
+    def _select_rules_for_security_groups(self, context, security_group_ids):
+        rules = dict((sg_id, []) for sg_id in security_group_ids)
+        if not rules:
+            return rules
+        sgr_sgid = sg_db.SecurityGroupRule.security_group_id
+        query = context.session.query(sg_db.SecurityGroupRule)
+        query = query.filter(sgr_sgid.in_(security_group_ids))
+        for rule_in_db in query:
+            rules[rule_in_db['security_group_id']].append(
+                self._make_security_group_rule_dict_for_agent(rule_in_db))
+        return rules
+
+    def _select_member_ips_for_remote_group(self, context, remote_group_ids):
+        ips = self._select_ips_for_remote_group(context, remote_group_ids)
+        member_ips = {}
+        for remote_group_id, ips_of_group in ips.iteritems():
+            members = {q_const.IPv4: [], q_const.IPv6: []}
+            for ip in ips_of_group:
+                net = netaddr.IPNetwork(ip)
+                ethertype = 'IPv%s' % net.version
+                cidr = str(net.cidr)
+                if cidr not in members[ethertype]:
+                    members[ethertype].append(cidr)
+            member_ips[remote_group_id] = members
+        return member_ips
+
     def _select_ips_for_remote_group(self, context, remote_group_ids):
         ips_by_group = {}
         if not remote_group_ids:
@@ -287,24 +470,31 @@ class SecurityGroupServerRpcCallbackMixin(object):
             self._add_ingress_dhcp_rule(port, ips)
 
     def _security_group_rules_for_ports(self, context, ports):
+        self._add_security_group_rules_to_ports(context, ports)
+        return self._convert_remote_group_id_to_ip_prefix(context, ports)
+
+    def _add_security_group_rules_to_ports(self, context, ports):
         rules_in_db = self._select_rules_for_ports(context, ports)
         for (binding, rule_in_db) in rules_in_db:
             port_id = binding['port_id']
             port = ports[port_id]
-            direction = rule_in_db['direction']
-            rule_dict = {
-                'security_group_id': rule_in_db['security_group_id'],
-                'direction': direction,
-                'ethertype': rule_in_db['ethertype'],
-            }
-            for key in ('protocol', 'port_range_min', 'port_range_max',
-                        'remote_ip_prefix', 'remote_group_id'):
-                if rule_in_db.get(key):
-                    if key == 'remote_ip_prefix':
-                        direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
-                        rule_dict[direction_ip_prefix] = rule_in_db[key]
-                        continue
-                    rule_dict[key] = rule_in_db[key]
-            port['security_group_rules'].append(rule_dict)
+            port['security_group_rules'].append(
+                self._make_security_group_rule_dict_for_agent(rule_in_db))
         self._apply_provider_rule(context, ports)
-        return self._convert_remote_group_id_to_ip_prefix(context, ports)
+
+    def _make_security_group_rule_dict_for_agent(self, rule_in_db):
+        direction = rule_in_db['direction']
+        rule_dict = {
+            'security_group_id': rule_in_db['security_group_id'],
+            'direction': direction,
+            'ethertype': rule_in_db['ethertype'],
+        }
+        for key in ('protocol', 'port_range_min', 'port_range_max',
+                    'remote_ip_prefix', 'remote_group_id'):
+            if rule_in_db.get(key):
+                if key == 'remote_ip_prefix':
+                    direction_ip_prefix = DIRECTION_IP_PREFIX[direction]
+                    rule_dict[direction_ip_prefix] = rule_in_db[key]
+                    continue
+                rule_dict[key] = rule_in_db[key]
+        return rule_dict
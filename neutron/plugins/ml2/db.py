@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
 from neutron.db import api as db_api
@@ -93,6 +94,45 @@ def get_port(session, port_id):
             return
 
 
+def get_ports_and_segments(session, port_ids):
+    """Get port records for update with their binding and bound segment.
+
+    The entries of port_ids may be prefixes of the actual port ids. The
+    result maps each entry of port_ids that matches exactly one port to a
+    (port, binding, segment) tuple, where binding and segment are None if
+    the port has no binding or is not bound to a segment.
+    """
+
+    if not port_ids:
+        return {}
+    with session.begin(subtransactions=True):
+        query = session.query(models_v2.Port, models.PortBinding,
+                              models.NetworkSegment)
+        query = query.outerjoin(
+            models.PortBinding,
+            models.PortBinding.port_id == models_v2.Port.id)
+        query = query.outerjoin(
+            models.NetworkSegment,
+            models.NetworkSegment.id == models.PortBinding.segment)
+        query = query.filter(sa.or_(*[models_v2.Port.id.startswith(port_id)
+                                      for port_id in port_ids]))
+        records = query.all()
+    by_id = dict((record[0].id, record) for record in records)
+    result = {}
+    for port_id in port_ids:
+        if port_id in by_id:
+            result[port_id] = by_id[port_id]
+            continue
+        matches = [record for record in records
+                   if record[0].id.startswith(port_id)]
+        if len(matches) == 1:
+            result[port_id] = matches[0]
+        elif matches:
+            LOG.error(_("Multiple ports have port_id starting with %s"),
+                      port_id)
+    return result
+
+
 def get_port_and_sgs(port_id):
     """Get port from database with security group info."""
 
@@ -41,10 +41,13 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
                    sg_db_rpc.SecurityGroupServerRpcCallbackMixin,
                    type_tunnel.TunnelRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.4'
     # history
     #   1.0 Initial version (from openvswitch/linuxbridge)
     #   1.1 Support Security Group RPC
+    #   1.2 Support get_devices_details_list and update_devices_down_list
+    #   1.3 Support security_group_info_for_devices
+    #   1.4 Support security_group_compact_info_for_devices
 
     def __init__(self, notifier, type_manager):
         # REVISIT(kmestery): This depends on the first three super classes
@@ -144,6 +147,67 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             LOG.debug(_("Returning: %s"), entry)
             return entry
 
+    def get_devices_details_list(self, rpc_context, **kwargs):
+        """Agent requests details of a list of devices."""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices')
+        LOG.debug(_("Details of %(count)s devices requested by agent "
+                    "%(agent_id)s"),
+                  {'count': len(devices), 'agent_id': agent_id})
+        port_ids = [self._device_to_port_id(device) for device in devices]
+
+        session = db_api.get_session()
+        with session.begin(subtransactions=True):
+            records = db.get_ports_and_segments(session, port_ids)
+            return [self._get_device_details(session, device, agent_id,
+                                             *records.get(port_id,
+                                                          (None,) * 3))
+                    for device, port_id in zip(devices, port_ids)]
+
+    def _get_device_details(self, session, device, agent_id, port, binding,
+                            segment):
+        if not port:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s not found in database"),
+                        {'device': device, 'agent_id': agent_id})
+            return {'device': device}
+
+        if not binding:
+            binding = db.ensure_port_binding(session, port.id)
+        if not binding.segment:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s on network %(network_id)s not "
+                          "bound, vif_type: %(vif_type)s"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id,
+                         'vif_type': binding.vif_type})
+            return {'device': device}
+
+        if not segment:
+            LOG.warning(_("Device %(device)s requested by agent "
+                          "%(agent_id)s on network %(network_id)s "
+                          "invalid segment, vif_type: %(vif_type)s"),
+                        {'device': device,
+                         'agent_id': agent_id,
+                         'network_id': port.network_id,
+                         'vif_type': binding.vif_type})
+            return {'device': device}
+
+        new_status = (q_const.PORT_STATUS_ACTIVE if port.admin_state_up
+                      else q_const.PORT_STATUS_DOWN)
+        if port.status != new_status:
+            port.status = new_status
+        entry = {'device': device,
+                 'network_id': port.network_id,
+                 'port_id': port.id,
+                 'admin_state_up': port.admin_state_up,
+                 'network_type': segment.network_type,
+                 'segmentation_id': segment.segmentation_id,
+                 'physical_network': segment.physical_network}
+        LOG.debug(_("Returning: %s"), entry)
+        return entry
+
     def _find_segment(self, segments, segment_id):
         for segment in segments:
             if segment[api.ID] == segment_id:
@@ -173,6 +237,34 @@ class RpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             return {'device': device,
                     'exists': True}
 
+    def update_devices_down_list(self, rpc_context, **kwargs):
+        """Devices no longer exist on agent."""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices')
+        LOG.debug(_("%(count)s devices no longer exist at agent "
+                    "%(agent_id)s"),
+                  {'count': len(devices), 'agent_id': agent_id})
+        port_ids = [self._device_to_port_id(device) for device in devices]
+
+        entries = []
+        session = db_api.get_session()
+        with session.begin(subtransactions=True):
+            records = db.get_ports_and_segments(session, port_ids)
+            for device, port_id in zip(devices, port_ids):
+                if port_id not in records:
+                    LOG.warning(_("Device %(device)s updated down by agent "
+                                  "%(agent_id)s not found in database"),
+                                {'device': device, 'agent_id': agent_id})
+                    entries.append({'device': device,
+                                    'exists': False})
+                    continue
+                port = records[port_id][0]
+                if port.status != q_const.PORT_STATUS_DOWN:
+                    port.status = q_const.PORT_STATUS_DOWN
+                entries.append({'device': device,
+                                'exists': True})
+        return entries
+
     def update_device_up(self, rpc_context, **kwargs):
         """Device is up on agent."""
         agent_id = kwargs.get('agent_id')
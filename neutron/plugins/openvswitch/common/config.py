@@ -69,6 +69,18 @@ agent_opts = [
                help=_("The UDP port to use for VXLAN tunnels.")),
     cfg.IntOpt('veth_mtu', default=None,
                help=_("MTU size of veth interfaces")),
+    cfg.BoolOpt('minimize_polling',
+                default=False,
+                help=_("Minimize polling by monitoring ovsdb for interface "
+                       "changes.")),
+    cfg.IntOpt('ovsdb_monitor_respawn_interval',
+               default=constants.DEFAULT_OVSDBMON_RESPAWN,
+               help=_("The number of seconds to wait before respawning the "
+                      "ovsdb monitor after losing communication with it.")),
+    cfg.IntOpt('polling_resync_interval', default=60,
+               help=_("When minimize_polling is enabled, the maximum number "
+                      "of seconds between full scans of the agent's "
+                      "bridges.")),
 ]
 
 
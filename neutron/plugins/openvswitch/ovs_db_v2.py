@@ -343,6 +343,30 @@ def get_port_from_device(port_id):
     return port_dict
 
 
+def get_ports_and_bindings(port_ids):
+    """Get (port, network binding) tuples for the given port ids."""
+    if not port_ids:
+        return []
+    session = db.get_session()
+    binding_network = ovs_models_v2.NetworkBinding.network_id
+
+    query = session.query(models_v2.Port, ovs_models_v2.NetworkBinding)
+    query = query.outerjoin(ovs_models_v2.NetworkBinding,
+                            models_v2.Port.network_id == binding_network)
+    query = query.filter(models_v2.Port.id.in_(port_ids))
+    return query.all()
+
+
+def set_ports_status(port_ids, status):
+    if not port_ids:
+        return
+    session = db.get_session()
+    with session.begin(subtransactions=True):
+        query = session.query(models_v2.Port)
+        query = query.filter(models_v2.Port.id.in_(port_ids))
+        query.update({'status': status}, synchronize_session=False)
+
+
 def set_port_status(port_id, status):
     session = db.get_session()
     try:
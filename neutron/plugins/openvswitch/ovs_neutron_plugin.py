@@ -70,8 +70,11 @@ class OVSRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
     # history
     #   1.0 Initial version
     #   1.1 Support Security Group RPC
+    #   1.2 Support get_devices_details_list and update_devices_down_list
+    #   1.3 Support security_group_info_for_devices
+    #   1.4 Support security_group_compact_info_for_devices
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.4'
 
     def __init__(self, notifier, tunnel_type):
         self.notifier = notifier
@@ -118,6 +121,39 @@ class OVSRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             LOG.debug(_("%s can not be found in database"), device)
         return entry
 
+    def get_devices_details_list(self, rpc_context, **kwargs):
+        """Agent requests details of a list of devices."""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices')
+        LOG.debug(_("Details of %(count)s devices requested from "
+                    "%(agent_id)s"),
+                  {'count': len(devices), 'agent_id': agent_id})
+        ports = dict((port['id'], (port, binding)) for port, binding in
+                     ovs_db_v2.get_ports_and_bindings(devices))
+        new_statuses = {q_const.PORT_STATUS_ACTIVE: [],
+                        q_const.PORT_STATUS_DOWN: []}
+        entries = []
+        for device in devices:
+            port, binding = ports.get(device, (None, None))
+            if not binding:
+                entries.append({'device': device})
+                LOG.debug(_("%s can not be found in database"), device)
+                continue
+            entries.append({'device': device,
+                            'network_id': port['network_id'],
+                            'port_id': port['id'],
+                            'admin_state_up': port['admin_state_up'],
+                            'network_type': binding.network_type,
+                            'segmentation_id': binding.segmentation_id,
+                            'physical_network': binding.physical_network})
+            new_status = (q_const.PORT_STATUS_ACTIVE if port['admin_state_up']
+                          else q_const.PORT_STATUS_DOWN)
+            if port['status'] != new_status:
+                new_statuses[new_status].append(port['id'])
+        for status, port_ids in new_statuses.iteritems():
+            ovs_db_v2.set_ports_status(port_ids, status)
+        return entries
+
     def update_device_down(self, rpc_context, **kwargs):
         """Device no longer exists on agent."""
         # TODO(garyk) - live migration and port status
@@ -138,6 +174,26 @@ class OVSRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             LOG.debug(_("%s can not be found in database"), device)
         return entry
 
+    def update_devices_down_list(self, rpc_context, **kwargs):
+        """Devices no longer exist on agent."""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices')
+        LOG.debug(_("%(count)s devices no longer exist on %(agent_id)s"),
+                  {'count': len(devices), 'agent_id': agent_id})
+        ports = dict((port['id'], port) for port, binding in
+                     ovs_db_v2.get_ports_and_bindings(devices))
+        entries = []
+        for device in devices:
+            entries.append({'device': device,
+                            'exists': device in ports})
+            if device not in ports:
+                LOG.debug(_("%s can not be found in database"), device)
+        ovs_db_v2.set_ports_status(
+            [port['id'] for port in ports.itervalues()
+             if port['status'] != q_const.PORT_STATUS_DOWN],
+            q_const.PORT_STATUS_DOWN)
+        return entries
+
     def update_device_up(self, rpc_context, **kwargs):
         """Device is up on agent."""
         agent_id = kwargs.get('agent_id')
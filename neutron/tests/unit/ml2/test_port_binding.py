@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 from neutron.extensions import portbindings
 from neutron import manager
 from neutron.plugins.ml2 import config as config
@@ -76,3 +78,31 @@ class PortBindingTestCase(test_plugin.NeutronDbPluginV2TestCase):
         self._test_port_binding("host-bridge-filter",
                                 portbindings.VIF_TYPE_BRIDGE,
                                 True, True)
+
+    def test_get_devices_details_list(self):
+        host_arg = {portbindings.HOST_ID: "host-ovs-no_filter"}
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                self.port(subnet=subnet, name='bound',
+                          arg_list=(portbindings.HOST_ID,), **host_arg),
+                self.port(subnet=subnet, name='unbound')
+            ) as (bound, unbound):
+                bound_id = bound['port']['id']
+                unbound_id = unbound['port']['id']
+                devices = ['tap' + bound_id[:11], unbound_id, 'unknown']
+                details = self.plugin.callbacks.get_devices_details_list(
+                    None, agent_id="theAgentId", devices=devices)
+                self.assertEqual([d['device'] for d in details], devices)
+                self.assertEqual(details[0]['port_id'], bound_id)
+                self.assertEqual(details[0]['network_type'], 'local')
+                self.assertNotIn('network_type', details[1])
+                self.assertNotIn('network_type', details[2])
+
+    def test_update_devices_down_list(self):
+        with self.port(name='name') as port:
+            port_id = port['port']['id']
+            details = self.plugin.callbacks.update_devices_down_list(
+                None, agent_id="theAgentId", devices=[port_id, 'unknown'])
+            self.assertEqual(details, [{'device': port_id, 'exists': True},
+                                       {'device': 'unknown',
+                                        'exists': False}])
@@ -13,7 +13,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+
 from neutron.extensions import portbindings
+from neutron import manager
 from neutron.tests.unit import _test_extension_portbindings as test_bindings
 from neutron.tests.unit import test_db_plugin as test_plugin
 from neutron.tests.unit import test_security_groups_rpc as test_sg_rpc
@@ -48,6 +51,45 @@ class TestOpenvswitchPortsV2(test_plugin.TestPortsV2,
             self.assertEqual(self.port_create_status, 'DOWN')
 
 
+class TestOpenvswitchRpcCallbacks(OpenvswitchPluginV2TestCase):
+
+    def setUp(self):
+        super(TestOpenvswitchRpcCallbacks, self).setUp()
+        self.callbacks = manager.NeutronManager.get_plugin().callbacks
+
+    def test_get_devices_details_list(self):
+        with self.subnet() as subnet:
+            with contextlib.nested(self.port(subnet=subnet),
+                                   self.port(subnet=subnet)) as (port1,
+                                                                 port2):
+                devices = [port1['port']['id'], 'unknown', port2['port']['id']]
+                details = self.callbacks.get_devices_details_list(
+                    None, agent_id='theAgentId', devices=devices)
+                self.assertEqual([d['device'] for d in details], devices)
+                self.assertEqual(details[0]['port_id'], devices[0])
+                self.assertEqual(details[0]['network_type'], 'local')
+                self.assertNotIn('port_id', details[1])
+                self.assertEqual(details[2]['port_id'], devices[2])
+                for port in (port1, port2):
+                    req = self.new_show_request('ports', port['port']['id'])
+                    res = self.deserialize(self.fmt, req.get_response(self.api))
+                    self.assertEqual(res['port']['status'], 'ACTIVE')
+
+    def test_update_devices_down_list(self):
+        with self.port() as port:
+            port_id = port['port']['id']
+            self.callbacks.get_devices_details_list(
+                None, agent_id='theAgentId', devices=[port_id])
+            details = self.callbacks.update_devices_down_list(
+                None, agent_id='theAgentId', devices=[port_id, 'unknown'])
+            self.assertEqual(details, [{'device': port_id, 'exists': True},
+                                       {'device': 'unknown',
+                                        'exists': False}])
+            req = self.new_show_request('ports', port_id)
+            res = self.deserialize(self.fmt, req.get_response(self.api))
+            self.assertEqual(res['port']['status'], 'DOWN')
+
+
 class TestOpenvswitchNetworksV2(test_plugin.TestNetworksV2,
                                 OpenvswitchPluginV2TestCase):
     pass
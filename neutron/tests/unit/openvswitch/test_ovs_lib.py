@@ -284,8 +284,11 @@ class OVS_Lib_Test(base.BaseTestCase):
                     ovs_row.append(cell)
                 elif isinstance(cell, dict):
                     ovs_row.append(["map", cell.items()])
+                elif isinstance(cell, (int, list)):
+                    ovs_row.append(cell)
                 else:
-                    raise TypeError('%r not str or dict' % type(cell))
+                    raise TypeError('%r not str, dict, int or list' %
+                                    type(cell))
         return jsonutils.dumps(r)
 
     def _test_get_vif_port_set(self, is_xen):
@@ -323,6 +326,38 @@ class OVS_Lib_Test(base.BaseTestCase):
         self.assertEqual(set(['tap99id']), port_set)
         self.mox.VerifyAll()
 
+    def test_get_vifs_by_ids(self):
+        utils.execute(["ovs-vsctl", self.TO, "list-ports", self.BR_NAME],
+                      root_helper=self.root_helper).AndReturn(
+                          'tap99\ntap77\ntap66\ntun22')
+        headings = ['name', 'external_ids', 'ofport']
+        data = [
+            # A vif port on this bridge:
+            ['tap99', {'iface-id': 'tap99id', 'attached-mac': 'tap99mac'}, 1],
+            # A vif port on another bridge:
+            ['tap88', {'iface-id': 'tap88id', 'attached-mac': 'tap88mac'}, 2],
+            # A vif port that was not asked for:
+            ['tap77', {'iface-id': 'tap77id', 'attached-mac': 'tap77mac'}, 3],
+            # A vif port without an ofport yet:
+            ['tap66', {'iface-id': 'tap66id', 'attached-mac': 'tap66mac'},
+             ['set', []]],
+            # Non-vif port on this bridge:
+            ['tun22', {}, 4],
+        ]
+        utils.execute(["ovs-vsctl", self.TO, "--format=json",
+                       "--", "--columns=name,external_ids,ofport",
+                       "list", "Interface"],
+                      root_helper=self.root_helper).AndReturn(
+                          self._encode_ovs_json(headings, data))
+        self.mox.ReplayAll()
+
+        vifs = self.br.get_vifs_by_ids(['tap99id', 'tap88id', 'tap66id'])
+        self.assertEqual(vifs.keys(), ['tap99id'])
+        self.assertEqual(vifs['tap99id'].port_name, 'tap99')
+        self.assertEqual(vifs['tap99id'].ofport, 1)
+        self.assertEqual(vifs['tap99id'].vif_mac, 'tap99mac')
+        self.mox.VerifyAll()
+
     def test_get_vif_ports_nonxen(self):
         self._test_get_vif_ports(False)
 
@@ -158,58 +158,72 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         self.assertEqual(expected, actual)
 
     def test_treat_devices_added_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
+        with mock.patch.object(self.agent.plugin_rpc,
+                               'get_devices_details_list',
                                side_effect=Exception()):
-            self.assertTrue(self.agent.treat_devices_added([{}]))
+            self.assertTrue(self.agent.treat_devices_added(['123']))
 
     def _mock_treat_devices_added(self, details, port, func_name):
         """Mock treat devices added.
 
         :param details: the details to return for the device
-        :param port: the port that get_vif_port_by_id should return
+        :param port: the port that get_vifs_by_ids should return
         :param func_name: the function that should be called
         :returns: whether the named function was called
         """
         with contextlib.nested(
-            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
-                              return_value=details),
-            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
-                              return_value=port),
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vifs_by_ids',
+                              return_value={'123': port}),
             mock.patch.object(self.agent, func_name)
         ) as (get_dev_fn, get_vif_func, func):
-            self.assertFalse(self.agent.treat_devices_added([{}]))
+            self.assertFalse(self.agent.treat_devices_added(['123']))
+        get_dev_fn.assert_called_once_with(self.agent.context, ['123'],
+                                           self.agent.agent_id)
+        get_vif_func.assert_called_once_with(['123'])
         return func.called
 
     def test_treat_devices_added_ignores_invalid_ofport(self):
         port = mock.Mock()
         port.ofport = -1
-        self.assertFalse(self._mock_treat_devices_added(mock.MagicMock(), port,
-                                                        'port_dead'))
+        self.assertFalse(self._mock_treat_devices_added({'device': '123'},
+                                                        port, 'port_dead'))
 
     def test_treat_devices_added_marks_unknown_port_as_dead(self):
         port = mock.Mock()
         port.ofport = 1
-        self.assertTrue(self._mock_treat_devices_added(mock.MagicMock(), port,
-                                                       'port_dead'))
+        self.assertTrue(self._mock_treat_devices_added({'device': '123'},
+                                                       port, 'port_dead'))
 
     def test_treat_devices_added_updates_known_port(self):
-        details = mock.MagicMock()
-        details.__contains__.side_effect = lambda x: True
+        details = {'device': '123',
+                   'port_id': '123',
+                   'network_id': 'net',
+                   'network_type': 'vlan',
+                   'physical_network': 'physnet',
+                   'segmentation_id': 1,
+                   'admin_state_up': True}
         self.assertTrue(self._mock_treat_devices_added(details,
                                                        mock.Mock(),
                                                        'treat_vif_port'))
 
     def test_treat_devices_removed_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        with mock.patch.object(self.agent.plugin_rpc,
+                               'update_devices_down_list',
                                side_effect=Exception()):
-            self.assertTrue(self.agent.treat_devices_removed([{}]))
+            self.assertTrue(self.agent.treat_devices_removed(['123']))
 
     def _mock_treat_devices_removed(self, port_exists):
-        details = dict(exists=port_exists)
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
-                               return_value=details):
+        details = dict(device='123', exists=port_exists)
+        with mock.patch.object(self.agent.plugin_rpc,
+                               'update_devices_down_list',
+                               return_value=[details]) as down_fn:
             with mock.patch.object(self.agent, 'port_unbound') as port_unbound:
-                self.assertFalse(self.agent.treat_devices_removed([{}]))
+                self.assertFalse(self.agent.treat_devices_removed(['123']))
+        down_fn.assert_called_once_with(self.agent.context, ['123'],
+                                        self.agent.agent_id)
         self.assertEqual(port_unbound.called, not port_exists)
 
     def test_treat_devices_removed_unbinds_port(self):
@@ -230,6 +244,31 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                 self.assertTrue(device_added.called)
                 self.assertTrue(device_removed.called)
 
+    def test_rpc_loop_polls_only_when_required(self):
+        class StopLoop(Exception):
+            pass
+
+        pm = mock.Mock()
+        type(pm).is_polling_required = mock.PropertyMock(
+            side_effect=[True, False])
+        pm.wait.side_effect = [None, StopLoop()]
+        with mock.patch.object(self.agent, 'update_ports',
+                               return_value=None) as update_ports:
+            self.assertRaises(StopLoop, self.agent.rpc_loop,
+                              polling_manager=pm)
+        update_ports.assert_called_once_with(set())
+        pm.force_polling.assert_called_once_with()
+        pm.polling_completed.assert_called_once_with()
+
+    def test_daemon_loop_uses_polling_manager(self):
+        with mock.patch('neutron.agent.linux.polling.'
+                        'get_polling_manager') as mock_get_pm:
+            with mock.patch.object(self.agent, 'rpc_loop') as mock_loop:
+                self.agent.daemon_loop()
+        mock_get_pm.assert_called_with(False, 'sudo', 30, 60)
+        mock_loop.assert_called_once_with(
+            polling_manager=mock_get_pm.return_value.__enter__.return_value)
+
     def test_report_state(self):
         with mock.patch.object(self.agent.state_rpc,
                                "report_state") as report_st:
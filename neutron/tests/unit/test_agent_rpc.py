@@ -19,6 +19,7 @@ import mock
 
 from neutron.agent import rpc
 from neutron.openstack.common import context
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.tests import base
 
 
@@ -45,6 +46,55 @@ class AgentRPCPluginApi(base.BaseTestCase):
     def test_tunnel_sync(self):
         self._test_rpc_call('tunnel_sync')
 
+    def _test_rpc_call_list(self, method):
+        agent = rpc.PluginApi('fake_topic')
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        with mock.patch('neutron.openstack.common.rpc.call') as rpc_call:
+            rpc_call.return_value = ['foo', 'bar']
+            actual_val = getattr(agent, method)(ctxt, ['dev1', 'dev2'],
+                                                'fake_agent_id')
+        self.assertEqual(actual_val, ['foo', 'bar'])
+        self.assertEqual(rpc_call.call_count, 1)
+        msg = rpc_call.call_args[0][2]
+        self.assertEqual(msg['method'], method)
+        self.assertEqual(msg['version'], '1.2')
+        self.assertEqual(msg['args']['devices'], ['dev1', 'dev2'])
+
+    def _test_rpc_call_list_fallback(self, method, fallback_method):
+        agent = rpc.PluginApi('fake_topic')
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        unsupported = rpc_common.RemoteError('UnsupportedRpcVersion')
+        with mock.patch('neutron.openstack.common.rpc.call') as rpc_call:
+            rpc_call.side_effect = [unsupported, 'foo', 'bar']
+            actual_val = getattr(agent, method)(ctxt, ['dev1', 'dev2'],
+                                                'fake_agent_id')
+        self.assertEqual(actual_val, ['foo', 'bar'])
+        self.assertEqual([c[0][2]['method'] for c in rpc_call.call_args_list],
+                         [method, fallback_method, fallback_method])
+
+    def test_get_devices_details_list(self):
+        self._test_rpc_call_list('get_devices_details_list')
+
+    def test_get_devices_details_list_fallback(self):
+        self._test_rpc_call_list_fallback('get_devices_details_list',
+                                          'get_device_details')
+
+    def test_update_devices_down_list(self):
+        self._test_rpc_call_list('update_devices_down_list')
+
+    def test_update_devices_down_list_fallback(self):
+        self._test_rpc_call_list_fallback('update_devices_down_list',
+                                          'update_device_down')
+
+    def test_get_devices_details_list_remote_error(self):
+        agent = rpc.PluginApi('fake_topic')
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        with mock.patch('neutron.openstack.common.rpc.call') as rpc_call:
+            rpc_call.side_effect = rpc_common.RemoteError('ValueError')
+            self.assertRaises(rpc_common.RemoteError,
+                              agent.get_devices_details_list,
+                              ctxt, ['dev1'], 'fake_agent_id')
+
 
 class AgentPluginReportState(base.BaseTestCase):
     def test_plugin_report_state_use_call(self):
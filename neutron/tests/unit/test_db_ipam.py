@@ -0,0 +1,168 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.config import cfg
+
+from neutron import context
+from neutron.db import ipam_db
+from neutron.db import models_v2
+from neutron.tests import base
+from neutron.tests.unit import test_db_plugin
+
+
+BITMAP_DRIVER = 'neutron.db.ipam_db.BitmapIpamDriver'
+
+
+class TestBitmap(base.BaseTestCase):
+
+    def test_new_bitmap_pads_last_byte(self):
+        bits = ipam_db._new_bitmap(10)
+        self.assertEqual(len(bits), 2)
+        self.assertEqual(bits[0], 0)
+        self.assertEqual(bits[1], 0xfc)
+
+    def test_first_free(self):
+        bits = ipam_db._new_bitmap(20)
+        self.assertEqual(ipam_db._first_free(bits), 0)
+        for i in range(11):
+            ipam_db._set_bit(bits, i)
+        self.assertEqual(ipam_db._first_free(bits), 11)
+        ipam_db._clear_bit(bits, 3)
+        self.assertEqual(ipam_db._first_free(bits), 3)
+
+    def test_first_free_full(self):
+        bits = ipam_db._new_bitmap(12)
+        for i in range(12):
+            ipam_db._set_bit(bits, i)
+        self.assertIsNone(ipam_db._first_free(bits))
+
+    def test_set_clear_test_bit(self):
+        bits = ipam_db._new_bitmap(16)
+        ipam_db._set_bit(bits, 9)
+        self.assertTrue(ipam_db._test_bit(bits, 9))
+        self.assertFalse(ipam_db._test_bit(bits, 8))
+        ipam_db._clear_bit(bits, 9)
+        self.assertFalse(ipam_db._test_bit(bits, 9))
+
+
+class BitmapIpamTestCaseMixin(object):
+
+    def setUp(self):
+        super(BitmapIpamTestCaseMixin, self).setUp()
+        cfg.CONF.set_override('ipam_driver', BITMAP_DRIVER)
+
+
+class TestBitmapIpamPortsV2(BitmapIpamTestCaseMixin,
+                            test_db_plugin.TestPortsV2):
+
+    def _get_bitmap(self, subnet_id):
+        ctx = context.get_admin_context()
+        return ctx.session.query(ipam_db.IPAvailabilityBitmap).join(
+            models_v2.IPAllocationPool).filter_by(subnet_id=subnet_id).one()
+
+    def test_bitmap_tracks_allocations(self):
+        with self.subnet(cidr='10.0.0.0/28') as subnet:
+            subnet_id = subnet['subnet']['id']
+            self.assertEqual(self._get_bitmap(subnet_id).free_count, 13)
+            with self.port(subnet=subnet) as port:
+                ips = port['port']['fixed_ips']
+                self.assertEqual(ips[0]['ip_address'], '10.0.0.2')
+                bitmap = self._get_bitmap(subnet_id)
+                self.assertEqual(bitmap.free_count, 12)
+                self.assertEqual(bitmap.version, 1)
+            self.assertEqual(self._get_bitmap(subnet_id).free_count, 13)
+
+    def test_recycled_ip_is_reused(self):
+        with self.subnet(cidr='10.0.0.0/28') as subnet:
+            with self.port(subnet=subnet) as port1:
+                with self.port(subnet=subnet):
+                    pass
+                with self.port(subnet=subnet) as port3:
+                    self.assertEqual(
+                        port3['port']['fixed_ips'][0]['ip_address'],
+                        '10.0.0.3')
+                self.assertEqual(port1['port']['fixed_ips'][0]['ip_address'],
+                                 '10.0.0.2')
+
+    def test_bitmap_built_for_range_pools(self):
+        cfg.CONF.set_override('ipam_driver',
+                              'neutron.db.ipam_db.RangeIpamDriver')
+        with self.subnet(cidr='10.0.0.0/28') as subnet:
+            subnet_id = subnet['subnet']['id']
+            fixed_ips = [{'subnet_id': subnet_id, 'ip_address': '10.0.0.2'}]
+            with self.port(subnet=subnet, fixed_ips=fixed_ips):
+                cfg.CONF.set_override('ipam_driver', BITMAP_DRIVER)
+                with self.port(subnet=subnet) as port:
+                    self.assertEqual(
+                        port['port']['fixed_ips'][0]['ip_address'],
+                        '10.0.0.3')
+                    bitmap = self._get_bitmap(subnet_id)
+                    self.assertEqual(bitmap.free_count, 11)
+                    ctx = context.get_admin_context()
+                    ranges = ctx.session.query(
+                        models_v2.IPAvailabilityRange).count()
+                    self.assertEqual(ranges, 0)
+
+    def test_cas_conflict_retries_with_lock(self):
+        with self.subnet(cidr='10.0.0.0/28') as subnet:
+            subnet_id = subnet['subnet']['id']
+            driver = ipam_db.BitmapIpamDriver()
+            ctx = context.get_admin_context()
+            pool_id = self._get_bitmap(subnet_id).allocation_pool_id
+            calls = []
+
+            def _update(bits):
+                calls.append(bits)
+                if len(calls) == 1:
+                    # Simulate another transaction winning the race
+                    ctx.session.query(ipam_db.IPAvailabilityBitmap).update(
+                        {'version': 5}, synchronize_session=False)
+                ipam_db._set_bit(bits, 0)
+                return -1
+
+            with ctx.session.begin():
+                self.assertEqual(
+                    driver._update_bitmap(ctx, pool_id, _update), -1)
+            self.assertEqual(len(calls), 2)
+            bitmap = self._get_bitmap(subnet_id)
+            self.assertEqual(bitmap.version, 6)
+            self.assertEqual(bitmap.free_count, 12)
+
+    def test_delete_subnet_deletes_bitmap(self):
+        with self.subnet(cidr='10.0.0.0/28'):
+            pass
+        ctx = context.get_admin_context()
+        self.assertEqual(
+            ctx.session.query(ipam_db.IPAvailabilityBitmap).count(), 0)
+
+    def test_ipv6_pool_uses_ranges(self):
+        with self.network() as network:
+            with self.subnet(network=network, cidr='2001:db8::/64',
+                             ip_version=6, gateway_ip='2001:db8::1') as subnet:
+                with self.port(subnet=subnet) as port:
+                    self.assertEqual(
+                        port['port']['fixed_ips'][0]['ip_address'],
+                        '2001:db8::2')
+                    ctx = context.get_admin_context()
+                    bitmaps = ctx.session.query(
+                        ipam_db.IPAvailabilityBitmap).count()
+                    self.assertEqual(bitmaps, 0)
+
+
+class TestBitmapIpamSubnetsV2(BitmapIpamTestCaseMixin,
+                              test_db_plugin.TestSubnetsV2):
+    pass
@@ -1126,3 +1126,61 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                  call.add_rule('ofake_dev', '-j $sg-fallback'),
                  call.add_rule('sg-chain', '-j ACCEPT')]
         self.v4filter_inst.assert_has_calls(calls)
+
+
+class IptablesFirewallEnhancedIpsetTestCase(IptablesFirewallTestCase):
+    def setUp(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        cfg.CONF.set_override(
+            'firewall_driver',
+            'neutron.agent.linux.iptables_firewall.IptablesFirewallDriver',
+            'SECURITYGROUP')
+        super(IptablesFirewallEnhancedIpsetTestCase, self).setUp()
+        self.firewall.ipset = mock.Mock()
+        self.firewall.ipset.ipsets = {}
+
+    def _remote_group_rule(self, direction):
+        return {'ethertype': 'IPv4',
+                'direction': direction,
+                'protocol': 'tcp',
+                'remote_group_id': 'fake_sgid'}
+
+    def test_update_security_group_members(self):
+        members = {'IPv4': ['10.0.0.1/32'], 'IPv6': ['fe80::1/128']}
+        self.firewall.update_security_group_members('fake_sgid', members)
+        self.firewall.ipset.set_members.assert_has_calls([
+            call('fake_sgid', 'IPv4', ['10.0.0.1/32']),
+            call('fake_sgid', 'IPv6', ['fe80::1/128'])])
+
+    def test_filter_ipv4_ingress_tcp_remote_group(self):
+        self.firewall.ipset.ipsets = {'NIPv4fake_sgid': set()}
+        rule = self._remote_group_rule('ingress')
+        ingress = call.add_rule(
+            'ifake_dev',
+            '-p tcp -m set --match-set NIPv4fake_sgid src -m tcp -j RETURN')
+        self._test_prepare_port_filter(rule, ingress, None)
+        self.assertFalse(self.firewall.ipset.set_members.called)
+        self.assertFalse(self.firewall.ipset.destroy.called)
+
+    def test_filter_ipv4_egress_tcp_remote_group(self):
+        self.firewall.ipset.ipsets = {'NIPv4fake_sgid': set()}
+        rule = self._remote_group_rule('egress')
+        egress = call.add_rule(
+            'ofake_dev',
+            '-p tcp -m set --match-set NIPv4fake_sgid dst -m tcp -j RETURN')
+        self._test_prepare_port_filter(rule, None, egress)
+
+    def test_remote_group_creates_missing_ipset(self):
+        port = self._fake_port()
+        port['security_group_rules'] = [self._remote_group_rule('ingress')]
+        self.firewall.prepare_port_filter(port)
+        self.firewall.ipset.set_members.assert_called_once_with(
+            'fake_sgid', 'IPv4', [])
+
+    def test_unused_ipsets_are_destroyed(self):
+        self.firewall.ipset.ipsets = {'NIPv4fake_sgid': set(),
+                                      'NIPv4unused': set()}
+        port = self._fake_port()
+        port['security_group_rules'] = [self._remote_group_rule('ingress')]
+        self.firewall.prepare_port_filter(port)
+        self.firewall.ipset.destroy.assert_called_once_with('NIPv4unused')
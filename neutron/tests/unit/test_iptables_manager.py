@@ -20,7 +20,9 @@
 import inspect
 import os
 
+import mock
 import mox
+from oslo.config import cfg
 
 from neutron.agent.linux import iptables_manager
 from neutron.tests import base
@@ -562,3 +564,103 @@ class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
     def test_nat_not_found(self):
         self.assertFalse('nat' in self.iptables.ipv4)
+
+
+class IptablesManagerIncrementalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesManagerIncrementalTestCase, self).setUp()
+        cfg.CONF.set_override('iptables_incremental_apply', True, 'AGENT')
+        self.addCleanup(cfg.CONF.reset)
+        self.root_helper = 'sudo'
+        self.iptables = iptables_manager.IptablesManager(
+            root_helper=self.root_helper, state_less=True)
+        self.execute = mock.Mock(return_value='')
+        self.iptables.execute = self.execute
+        self.save_output = ''
+
+        def _execute(args, process_input=None, root_helper=None):
+            if args[0] == 'iptables-save' and '-t' in args:
+                return self.save_output
+            return ''
+        self.execute.side_effect = _execute
+
+        self.iptables.ipv4['filter'].add_chain('sg')
+        self.iptables.ipv4['filter'].add_rule('sg', '-j DROP')
+        self.iptables.apply()
+        self.assertEqual(self.execute.call_count, 2)
+        self.execute.reset_mock()
+        self.chain = '%s-sg' % iptables_manager.binary_name
+
+    def _restore_call(self, script):
+        return mock.call(['iptables-restore', '--noflush'],
+                         process_input=script,
+                         root_helper=self.root_helper)
+
+    def test_no_changes_does_nothing(self):
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+
+    def test_changed_chain_is_rewritten(self):
+        self.iptables.ipv4['filter'].add_rule('sg', '-s 10.0.0.1 -j RETURN',
+                                              top=True)
+        self.save_output = (':%(chain)s - [0:0]\n'
+                            '-A %(chain)s -s 10.0.0.1 -j RETURN\n'
+                            '-A %(chain)s -j DROP\n' % {'chain': self.chain})
+        self.iptables.apply()
+        script = ('*filter\n'
+                  ':%(chain)s - [0:0]\n'
+                  '-A %(chain)s -s 10.0.0.1 -j RETURN\n'
+                  '-A %(chain)s -j DROP\n'
+                  'COMMIT\n' % {'chain': self.chain})
+        self.execute.assert_has_calls([
+            self._restore_call(script),
+            mock.call(['iptables-save', '-t', 'filter'],
+                      root_helper=self.root_helper)])
+        self.assertEqual(self.execute.call_count, 2)
+
+    def test_removed_chain_is_deleted(self):
+        self.iptables.ipv4['filter'].remove_chain('sg')
+        self.iptables.apply()
+        script = ('*filter\n'
+                  ':%(chain)s - [0:0]\n'
+                  '-X %(chain)s\n'
+                  'COMMIT\n' % {'chain': self.chain})
+        self.execute.assert_has_calls([self._restore_call(script)])
+
+    def test_unwrapped_change_applies_full(self):
+        self.iptables.ipv4['filter'].add_rule('FORWARD', '-j ACCEPT',
+                                              wrap=False)
+        self.iptables.apply()
+        self.execute.assert_has_calls([
+            mock.call(['iptables-save', '-c'],
+                      root_helper=self.root_helper),
+            mock.call(['iptables-restore', '-c'], process_input=mock.ANY,
+                      root_helper=self.root_helper)])
+        self.assertEqual(self.execute.call_count, 2)
+
+    def test_verification_failure_applies_full(self):
+        self.iptables.ipv4['filter'].add_rule('sg', '-j ACCEPT')
+        self.save_output = ':%s - [0:0]\n' % self.chain
+        self.iptables.apply()
+        self.assertEqual(self.execute.call_count, 4)
+        self.execute.assert_called_with(['iptables-restore', '-c'],
+                                        process_input=mock.ANY,
+                                        root_helper=self.root_helper)
+
+    def test_restore_failure_applies_full(self):
+        def _execute(args, process_input=None, root_helper=None):
+            if '--noflush' in args:
+                raise RuntimeError()
+            return ''
+        self.execute.side_effect = _execute
+        self.iptables.ipv4['filter'].add_rule('sg', '-j ACCEPT')
+        self.iptables.apply()
+        self.assertEqual(self.execute.call_count, 3)
+        self.execute.assert_called_with(['iptables-restore', '-c'],
+                                        process_input=mock.ANY,
+                                        root_helper=self.root_helper)
+        # The full apply records the state for the next incremental apply
+        self.execute.reset_mock()
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
@@ -17,6 +17,7 @@
 
 import copy
 
+import eventlet
 import mock
 from oslo.config import cfg
 
@@ -524,6 +525,37 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent._process_routers(routers)
         self.assertNotIn(routers[0]['id'], agent.router_info)
 
+    def test_process_routers_queues_updates(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        router = self._prepare_router_data()
+        router.update({'admin_state_up': True, 'external_gateway_info': {}})
+        agent.process_router = mock.Mock()
+        agent._process_routers([router])
+        self.assertNotIn(router['id'], agent.router_info)
+
+        agent._queue.process_all()
+        ri = agent.router_info[router['id']]
+        agent.process_router.assert_called_once_with(ri)
+        stats = agent.get_router_processing_stats()
+        self.assertEqual(stats['routers_processed'], 1)
+        self.assertEqual(stats['router_update_queue_size'], 0)
+        self.assertIn('router_processing_latency_max', stats)
+        self.assertEqual(agent.get_router_processing_stats(),
+                         {'routers_processed': 0,
+                          'router_update_queue_size': 0})
+
+    def test_process_routers_failure_sets_fullsync(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        router = self._prepare_router_data()
+        router.update({'admin_state_up': True, 'external_gateway_info': {}})
+        agent.fullsync = False
+        agent.process_router = mock.Mock(side_effect=RuntimeError())
+        agent._process_routers([router])
+        agent._queue.process_all()
+        self.assertTrue(agent.fullsync)
+
     def test_router_deleted(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent.router_deleted(None, FAKE_ID)
@@ -565,6 +597,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent.router_deleted(None, router['id'])
         agent._process_router_delete()
         self.assertFalse(list(agent.removed_routers))
+        agent._queue.process_all()
+        self.assertNotIn(router['id'], agent.router_info)
 
     def testDestroyNamespace(self):
 
@@ -712,3 +746,51 @@ class TestL3AgentEventHandler(base.BaseTestCase):
                 ])
         finally:
             self.external_process_p.start()
+
+
+class TestRouterProcessingQueue(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRouterProcessingQueue, self).setUp()
+        self.processed = []
+        self.active = set()
+
+    def _process(self, update):
+        # Routers must not be processed concurrently
+        self.assertNotIn(update.id, self.active)
+        self.active.add(update.id)
+        eventlet.sleep(0)
+        self.processed.append((update.id, update.router))
+        self.active.remove(update.id)
+
+    def test_updates_are_processed_by_priority(self):
+        queue = l3_agent.RouterProcessingQueue(self._process, 1)
+        queue.add(l3_agent.RouterUpdate(
+            'sync', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, timestamp=1))
+        queue.add(l3_agent.RouterUpdate(
+            'rpc', l3_agent.PRIORITY_RPC, timestamp=2))
+        queue.process_all()
+        self.assertEqual(self.processed, [('rpc', None), ('sync', None)])
+
+    def test_updates_of_a_router_are_processed_in_order(self):
+        queue = l3_agent.RouterProcessingQueue(self._process, 4)
+        for i in range(3):
+            queue.add(l3_agent.RouterUpdate('r1', l3_agent.PRIORITY_RPC,
+                                            router=i, timestamp=i + 1))
+        queue.add(l3_agent.RouterUpdate('r2', l3_agent.PRIORITY_RPC,
+                                        timestamp=1))
+        queue.process_all()
+        self.assertEqual([u for u in self.processed if u[0] == 'r1'],
+                         [('r1', 0), ('r1', 1), ('r1', 2)])
+        self.assertIn(('r2', None), self.processed)
+        self.assertEqual(queue.qsize(), 0)
+
+    def test_outdated_updates_are_skipped(self):
+        queue = l3_agent.RouterProcessingQueue(self._process, 4)
+        queue.add(l3_agent.RouterUpdate('r1', l3_agent.PRIORITY_RPC,
+                                        router='new', timestamp=2))
+        queue.add(l3_agent.RouterUpdate(
+            'r1', l3_agent.PRIORITY_SYNC_ROUTERS_TASK, router='old',
+            timestamp=1))
+        queue.process_all()
+        self.assertEqual(self.processed, [('r1', 'new')])
@@ -0,0 +1,87 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import ipset_manager
+from neutron.tests import base
+
+FAKE_ID = 'fake_sgid'
+FAKE_NAME = 'NIPv4fake_sgid'
+
+
+class TestIpsetManager(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestIpsetManager, self).setUp()
+        self.execute = mock.Mock()
+        self.ipset = ipset_manager.IpsetManager(execute=self.execute,
+                                                root_helper='sudo')
+
+    def _assert_restored(self, lines):
+        self.execute.assert_called_once_with(
+            ['ipset', 'restore', '-exist'],
+            process_input='\n'.join(lines) + '\n',
+            root_helper='sudo')
+
+    def test_get_name_is_truncated(self):
+        name = ipset_manager.get_name('a' * 36, 'IPv6')
+        self.assertEqual(len(name), ipset_manager.MAX_NAME_LEN)
+        self.assertTrue(name.startswith('NIPv6'))
+
+    def test_set_members_creates_set(self):
+        name = self.ipset.set_members(FAKE_ID, 'IPv4',
+                                      ['10.0.0.2/32', '10.0.0.1/32'])
+        self.assertEqual(name, FAKE_NAME)
+        self._assert_restored(['create %s hash:net family inet' % FAKE_NAME,
+                               'flush %s' % FAKE_NAME,
+                               'add %s 10.0.0.1/32' % FAKE_NAME,
+                               'add %s 10.0.0.2/32' % FAKE_NAME])
+        self.assertEqual(self.ipset.ipsets[FAKE_NAME],
+                         set(['10.0.0.1/32', '10.0.0.2/32']))
+
+    def test_set_members_applies_difference(self):
+        self.ipset.ipsets[FAKE_NAME] = set(['10.0.0.1/32', '10.0.0.2/32'])
+        self.ipset.set_members(FAKE_ID, 'IPv4',
+                               ['10.0.0.2/32', '10.0.0.3/32'])
+        self._assert_restored(['add %s 10.0.0.3/32' % FAKE_NAME,
+                               'del %s 10.0.0.1/32' % FAKE_NAME])
+
+    def test_set_members_unchanged_is_noop(self):
+        self.ipset.ipsets[FAKE_NAME] = set(['10.0.0.1/32'])
+        self.ipset.set_members(FAKE_ID, 'IPv4', ['10.0.0.1/32'])
+        self.assertFalse(self.execute.called)
+
+    def test_set_members_failure_forgets_set(self):
+        self.ipset.ipsets[FAKE_NAME] = set(['10.0.0.1/32'])
+        self.execute.side_effect = RuntimeError()
+        self.assertRaises(RuntimeError, self.ipset.set_members,
+                          FAKE_ID, 'IPv4', [])
+        self.assertNotIn(FAKE_NAME, self.ipset.ipsets)
+
+    def test_destroy(self):
+        self.ipset.ipsets[FAKE_NAME] = set()
+        self.ipset.destroy(FAKE_NAME)
+        self.execute.assert_called_once_with(['ipset', 'destroy', FAKE_NAME],
+                                             root_helper='sudo')
+        self.assertNotIn(FAKE_NAME, self.ipset.ipsets)
+
+    def test_destroy_failure_keeps_set(self):
+        self.ipset.ipsets[FAKE_NAME] = set()
+        self.execute.side_effect = RuntimeError()
+        self.ipset.destroy(FAKE_NAME)
+        self.assertIn(FAKE_NAME, self.ipset.ipsets)
@@ -0,0 +1,108 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+#
+# Copyright 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+import mock
+
+from neutron.agent.linux import ovsdb_monitor
+from neutron.tests import base
+
+
+class TestOvsdbMonitor(base.BaseTestCase):
+
+    def test___init__(self):
+        monitor = ovsdb_monitor.OvsdbMonitor('Interface',
+                                             columns=['name', 'ofport'],
+                                             format='json')
+        self.assertEqual(monitor.cmd,
+                         ['ovsdb-client', 'monitor', 'Interface',
+                          'name,ofport', '--format=json'])
+
+    def test__read_stderr_logs_errors(self):
+        monitor = ovsdb_monitor.OvsdbMonitor('Interface')
+        monitor._process = mock.Mock()
+        monitor._process.stderr.readline.return_value = 'error\n'
+        with mock.patch.object(ovsdb_monitor.LOG, 'error') as log_error:
+            self.assertTrue(monitor._read_stderr())
+        self.assertTrue(log_error.called)
+        self.assertEqual(list(monitor.iter_stderr()), [])
+
+
+class TestSimpleInterfaceMonitor(base.BaseTestCase):
+
+    INITIAL = ('{"data":[["2d4be2a4-7f7c-4cbd-8f6e-4f8a2c21a3d9","initial",'
+               '"tap1",1,["map",[["iface-id","p1"]]]]],'
+               '"headings":["row","action","name","ofport",'
+               '"external_ids"]}')
+    MODIFIED = ('{"data":[["2d4be2a4-7f7c-4cbd-8f6e-4f8a2c21a3d9","old",'
+                '"",-1,""],["2d4be2a4-7f7c-4cbd-8f6e-4f8a2c21a3d9","new",'
+                '"tap2",2,["map",[]]]],'
+                '"headings":["row","action","name","ofport",'
+                '"external_ids"]}')
+
+    def setUp(self):
+        super(TestSimpleInterfaceMonitor, self).setUp()
+        self.monitor = ovsdb_monitor.SimpleInterfaceMonitor()
+
+    def test_is_active_is_false_by_default(self):
+        self.assertFalse(self.monitor.is_active)
+
+    def test_is_active_can_be_true(self):
+        self.monitor.data_received = True
+        self.monitor._kill_event = mock.Mock()
+        self.monitor._kill_event.ready.return_value = False
+        self.assertTrue(self.monitor.is_active)
+
+    def test_has_updates_is_true_by_default(self):
+        self.assertTrue(self.monitor.has_updates)
+
+    def _make_active(self):
+        self.monitor.data_received = True
+        self.monitor._kill_event = mock.Mock()
+        self.monitor._kill_event.ready.return_value = False
+
+    def test_has_updates_is_false_if_active_with_no_output(self):
+        self._make_active()
+        self.assertFalse(self.monitor.has_updates)
+
+    def test_has_updates_is_true_if_active_with_output(self):
+        self._make_active()
+        self.monitor._stdout_lines.put(self.INITIAL)
+        self.assertTrue(self.monitor.has_updates)
+        self.assertFalse(self.monitor.has_updates)
+
+    def test_get_changed_interfaces_parses_output(self):
+        self.monitor._stdout_lines.put(self.INITIAL)
+        self.monitor._stdout_lines.put(self.MODIFIED)
+        self.assertEqual(self.monitor.get_changed_interfaces(),
+                         set(['tap1', 'tap2']))
+        self.assertTrue(self.monitor.data_received)
+
+    def test_get_changed_interfaces_reports_unparseable_output(self):
+        self.monitor._stdout_lines.put('garbage')
+        self.assertEqual(self.monitor.get_changed_interfaces(),
+                         set(['garbage']))
+        self.assertFalse(self.monitor.data_received)
+
+    def test_wait_keeps_output_for_has_updates(self):
+        self._make_active()
+        self.monitor._stdout_lines.put(self.INITIAL)
+        self.assertTrue(self.monitor.wait(0.01))
+        self.assertTrue(self.monitor.has_updates)
+
+    def test_wait_returns_false_without_output(self):
+        self.assertFalse(self.monitor.wait(0.01))
@@ -16,6 +16,7 @@
 #    under the License.
 
 from contextlib import nested
+import copy
 
 import mock
 from mock import call
@@ -26,11 +27,13 @@ from neutron.agent import firewall as firewall_base
 from neutron.agent.linux import iptables_manager
 from neutron.agent import rpc as agent_rpc
 from neutron.agent import securitygroups_rpc as sg_rpc
+from neutron.common import constants as const
 from neutron import context
 from neutron.db import securitygroups_rpc_base as sg_db_rpc
 from neutron.extensions import allowedaddresspairs as addr_pair
 from neutron.extensions import securitygroup as ext_sg
 from neutron.manager import NeutronManager
+from neutron.openstack.common.rpc import common as rpc_common
 from neutron.openstack.common.rpc import proxy
 from neutron.tests import base
 from neutron.tests.unit import test_extension_security_group as test_sg
@@ -52,6 +55,7 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
     def setUp(self, plugin=None):
         super(SGServerRpcCallBackMixinTestCase, self).setUp()
         self.rpc = FakeSGCallback()
+        sg_db_rpc.sg_info_cache.clear()
 
     def test_security_group_rules_for_devices_ipv4_ingress(self):
         fake_prefix = test_fw.FAKE_PREFIX['IPv4']
@@ -278,6 +282,151 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
+    def test_security_group_info_for_devices_ipv4_source_group(self):
+
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                rule1 = self._build_security_group_rule(
+                    sg1_id,
+                    'ingress', 'tcp', '24',
+                    '25', remote_group_id=sg2['security_group']['id'])
+                rules = {
+                    'security_group_rules': [rule1['security_group_rule']]}
+                res = self._create_security_group_rule(self.fmt, rules)
+                self.deserialize(self.fmt, res)
+                self.assertEqual(res.status_int, 201)
+
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                self.rpc.devices = {port_id1: ports_rest1['port']}
+                devices = [port_id1, 'no_exist_device']
+
+                res2 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg2_id])
+                ports_rest2 = self.deserialize(self.fmt, res2)
+                port_id2 = ports_rest2['port']['id']
+                port_ip2 = ports_rest2['port']['fixed_ips'][0]['ip_address']
+                ctx = context.get_admin_context()
+                info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=devices)
+                port_rpc = info['devices'][port_id1]
+                expected = [{'direction': 'egress', 'ethertype': 'IPv4',
+                             'security_group_id': sg1_id},
+                            {'direction': 'egress', 'ethertype': 'IPv6',
+                             'security_group_id': sg1_id},
+                            {'direction': u'ingress',
+                             'protocol': u'tcp', 'ethertype': u'IPv4',
+                             'port_range_max': 25, 'port_range_min': 24,
+                             'remote_group_id': sg2_id,
+                             'security_group_id': sg1_id},
+                            ]
+                self.assertEqual(port_rpc['security_group_rules'],
+                                 expected)
+                self.assertEqual(port_rpc['security_group_source_groups'],
+                                 [sg2_id])
+                self.assertEqual(info['sg_member_ips'],
+                                 {sg2_id: {'IPv4': ['%s/32' % port_ip2],
+                                           'IPv6': []}})
+                self._delete('ports', port_id1)
+                self._delete('ports', port_id2)
+
+    def _create_ports_sharing_security_group(self, n, sg1_id, sg2_id):
+        rule1 = self._build_security_group_rule(
+            sg1_id, 'ingress', 'tcp', '24', '25', remote_group_id=sg2_id)
+        rules = {'security_group_rules': [rule1['security_group_rule']]}
+        res = self._create_security_group_rule(self.fmt, rules)
+        self.assertEqual(res.status_int, 201)
+        ports = []
+        for sg_id in (sg1_id, sg1_id, sg2_id):
+            res = self._create_port(self.fmt, n['network']['id'],
+                                    security_groups=[sg_id])
+            ports.append(self.deserialize(self.fmt, res)['port'])
+        self.rpc.devices = dict((port['id'], port) for port in ports)
+        return ports
+
+    def test_security_group_compact_info_for_devices(self):
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                ports = self._create_ports_sharing_security_group(
+                    n, sg1_id, sg2_id)
+                port_ip3 = ports[2]['fixed_ips'][0]['ip_address']
+                devices = [port['id'] for port in ports] + ['no_exist']
+                ctx = context.get_admin_context()
+                info = self.rpc.security_group_compact_info_for_devices(
+                    ctx, devices=devices)
+                self.assertEqual(set(info['security_groups']),
+                                 set([sg1_id, sg2_id]))
+                self.assertIn({'direction': u'ingress',
+                               'protocol': u'tcp', 'ethertype': u'IPv4',
+                               'port_range_max': 25, 'port_range_min': 24,
+                               'remote_group_id': sg2_id,
+                               'security_group_id': sg1_id},
+                              info['security_groups'][sg1_id])
+                self.assertEqual(len(info['security_groups'][sg1_id]), 3)
+                self.assertEqual(info['sg_member_ips'],
+                                 {sg2_id: {'IPv4': ['%s/32' % port_ip3],
+                                           'IPv6': []}})
+                for port in ports[:2]:
+                    device = info['devices'][port['id']]
+                    self.assertEqual(device['security_groups'], [sg1_id])
+                    self.assertEqual(device['security_group_rules'], [])
+                    self.assertEqual(
+                        device['security_group_source_groups'], [sg2_id])
+                device = info['devices'][ports[2]['id']]
+                self.assertEqual(device['security_group_source_groups'], [])
+                for port in ports:
+                    self._delete('ports', port['id'])
+
+    def test_security_group_compact_info_for_devices_is_cached(self):
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                ports = self._create_ports_sharing_security_group(
+                    n, sg1_id, sg2_id)
+                port = copy.deepcopy(ports[0])
+                ctx = context.get_admin_context()
+
+                def get_info():
+                    # The fake callback modifies the devices it returns
+                    self.rpc.devices = {port['id']: copy.deepcopy(port)}
+                    return self.rpc.security_group_compact_info_for_devices(
+                        ctx, devices=[port['id']])
+
+                get_info()
+                rule = self._build_security_group_rule(
+                    sg1_id, 'ingress', 'tcp', '22', '22')
+                res = self._create_security_group_rule(self.fmt, rule)
+                self.assertEqual(res.status_int, 201)
+                info = get_info()
+                self.assertEqual(len(info['security_groups'][sg1_id]), 3)
+
+                sg_db_rpc.sg_info_cache.invalidate_rules([sg1_id])
+                info = get_info()
+                self.assertEqual(len(info['security_groups'][sg1_id]), 4)
+                for port in ports:
+                    self._delete('ports', port['id'])
+
     def test_security_group_rules_for_devices_ipv6_ingress(self):
         fake_prefix = test_fw.FAKE_PREFIX['IPv6']
         with self.network() as n:
@@ -463,6 +612,71 @@ class SGServerRpcCallBackMixinTestCaseXML(SGServerRpcCallBackMixinTestCase):
     fmt = 'xml'
 
 
+class SecurityGroupInfoCacheTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(SecurityGroupInfoCacheTestCase, self).setUp()
+        self.cache = sg_db_rpc.SecurityGroupInfoCache()
+
+    def test_get_selects_missing_entries_only(self):
+        select = mock.Mock(return_value={'sg2': ['rule2']})
+        self.cache.rules['sg1'] = ['rule1']
+        rules = self.cache.get(self.cache.rules, ['sg1', 'sg2'], select)
+        select.assert_called_once_with(['sg2'])
+        self.assertEqual(rules, {'sg1': ['rule1'], 'sg2': ['rule2']})
+        self.assertEqual(self.cache.rules, rules)
+
+    def test_invalidate(self):
+        self.cache.rules['sg1'] = ['rule1']
+        self.cache.member_ips['sg1'] = {}
+        self.cache.invalidate_rules(['sg1', 'sg2'])
+        self.assertNotIn('sg1', self.cache.rules)
+        self.assertIn('sg1', self.cache.member_ips)
+
+    def test_get_does_not_store_result_racing_invalidation(self):
+        def select(keys):
+            self.cache.invalidate_rules(keys)
+            return {'sg1': ['stale']}
+
+        rules = self.cache.get(self.cache.rules, ['sg1'], select)
+        self.assertEqual(rules, {'sg1': ['stale']})
+        self.assertNotIn('sg1', self.cache.rules)
+
+
+class SGServerRpcMixinCacheTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(SGServerRpcMixinCacheTestCase, self).setUp()
+        self.mixin = sg_db_rpc.SecurityGroupServerRpcMixin()
+        self.mixin.notifier = mock.Mock()
+        self.cache = sg_db_rpc.sg_info_cache
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+        self.cache.member_ips.update({'sg1': {}, 'sg2': {}})
+        self.cache.dhcp_ips['net1'] = []
+
+    def test_member_update_invalidates_member_ips(self):
+        port = {'device_owner': 'compute:nova', 'network_id': 'net1',
+                ext_sg.SECURITYGROUPS: ['sg1']}
+        self.mixin.notify_security_groups_member_updated(None, port)
+        self.assertEqual(self.cache.member_ips, {'sg2': {}})
+        self.assertIn('net1', self.cache.dhcp_ips)
+
+    def test_dhcp_port_update_invalidates_dhcp_ips(self):
+        port = {'device_owner': const.DEVICE_OWNER_DHCP,
+                'network_id': 'net1'}
+        self.mixin.notify_security_groups_member_updated(None, port)
+        self.assertNotIn('net1', self.cache.dhcp_ips)
+        self.assertEqual(len(self.cache.member_ips), 2)
+
+    def test_port_leaving_group_invalidates_member_ips(self):
+        original_port = {'fixed_ips': [], ext_sg.SECURITYGROUPS: ['sg1']}
+        updated_port = {'fixed_ips': [], ext_sg.SECURITYGROUPS: ['sg2'],
+                        'device_owner': 'compute:nova',
+                        'network_id': 'net1'}
+        self.mixin.is_security_group_member_updated(None, original_port,
+                                                    updated_port)
+        self.assertEqual(self.cache.member_ips, {})
+
+
 class SGAgentRpcCallBackMixinTestCase(base.BaseTestCase):
     def setUp(self):
         super(SGAgentRpcCallBackMixinTestCase, self).setUp()
@@ -487,9 +701,9 @@ class SGAgentRpcCallBackMixinTestCase(base.BaseTestCase):
             [call.security_groups_provider_updated()])
 
 
-class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
+class BaseSecurityGroupAgentRpcTestCase(base.BaseTestCase):
     def setUp(self):
-        super(SecurityGroupAgentRpcTestCase, self).setUp()
+        super(BaseSecurityGroupAgentRpcTestCase, self).setUp()
         self.agent = sg_rpc.SecurityGroupAgentRpcMixin()
         self.agent.context = None
         self.addCleanup(mock.patch.stopall)
@@ -513,6 +727,8 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         self.firewall.ports = fake_devices
         rpc.security_group_rules_for_devices.return_value = fake_devices
 
+
+class SecurityGroupAgentRpcTestCase(BaseSecurityGroupAgentRpcTestCase):
     def test_prepare_and_remove_devices_filter(self):
         self.agent.prepare_devices_filter(['fake_device'])
         self.agent.remove_devices_filter(['fake_device'])
@@ -580,6 +796,115 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         self.firewall.assert_has_calls([])
 
 
+class SecurityGroupAgentCompactRpcTestCase(BaseSecurityGroupAgentRpcTestCase):
+    def setUp(self):
+        super(SecurityGroupAgentCompactRpcTestCase, self).setUp()
+        self.agent.use_compact_rpc = True
+        self.rule1 = {'security_group_id': 'fake_sgid1',
+                      'direction': 'ingress', 'ethertype': 'IPv4',
+                      'protocol': 'tcp'}
+        self.rule2 = {'security_group_id': 'fake_sgid1',
+                      'direction': 'ingress', 'ethertype': 'IPv4',
+                      'remote_group_id': 'fake_sgid2'}
+        self.provider_rule = {'direction': 'ingress', 'ethertype': 'IPv4',
+                              'source_ip_prefix': '10.0.0.254/32'}
+        self.sg_members = {'IPv4': ['10.0.0.2/32', '10.0.0.3/32'],
+                           'IPv6': []}
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_compact_info_for_devices.return_value = {
+            'devices': {'fake_device': {
+                'device': 'fake_device',
+                'fixed_ips': ['10.0.0.2'],
+                'security_groups': ['fake_sgid1'],
+                'security_group_rules': [self.provider_rule],
+                'security_group_source_groups': ['fake_sgid2']}},
+            'security_groups': {'fake_sgid1': [self.rule1, self.rule2]},
+            'sg_member_ips': {'fake_sgid2': self.sg_members}}
+
+    def _prepared_rules(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        device = self.firewall.prepare_port_filter.call_args[0][0]
+        return device['security_group_rules']
+
+    def test_prepare_devices_filter_expands_remote_groups(self):
+        rule3 = dict(self.rule2, source_ip_prefix='10.0.0.3/32')
+        self.assertEqual(self._prepared_rules(),
+                         [self.rule1, rule3, self.provider_rule])
+        self.assertFalse(self.firewall.update_security_group_members.called)
+
+    def test_prepare_devices_filter_with_ipset(self):
+        self.agent.use_ipset = True
+        self.assertEqual(self._prepared_rules(),
+                         [self.rule1, self.rule2, self.provider_rule])
+        self.firewall.update_security_group_members.assert_called_once_with(
+            'fake_sgid2', self.sg_members)
+
+    def test_prepare_devices_filter_falls_back_for_old_plugin(self):
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_compact_info_for_devices.side_effect = (
+            rpc_common.RemoteError('UnsupportedRpcVersion'))
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.assertFalse(self.agent.use_compact_rpc)
+        rpc.security_group_rules_for_devices.assert_called_once_with(
+            None, ['fake_device'])
+        self.firewall.assert_has_calls([
+            call.defer_apply(),
+            call.prepare_port_filter(self.fake_device)])
+
+
+class SecurityGroupAgentRpcWithIpsetTestCase(
+        BaseSecurityGroupAgentRpcTestCase):
+    def setUp(self):
+        super(SecurityGroupAgentRpcWithIpsetTestCase, self).setUp()
+        self.agent.use_ipset = True
+        self.sg_members = {'IPv4': ['10.0.0.2/32'], 'IPv6': []}
+        self.agent.plugin_rpc.security_group_info_for_devices.return_value = {
+            'devices': self.firewall.ports,
+            'sg_member_ips': {'fake_sgid2': self.sg_members}}
+
+    def test_prepare_devices_filter_updates_members(self):
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.firewall.assert_has_calls([
+            call.update_security_group_members('fake_sgid2',
+                                               self.sg_members),
+            call.defer_apply(),
+            call.prepare_port_filter(self.fake_device)])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_rules_for_devices.called)
+
+    def test_security_groups_member_updated(self):
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.security_groups_member_updated(['fake_sgid2', 'fake_sgid3'])
+        self.assertFalse(self.agent.refresh_firewall.called)
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.assert_called_with(
+            None, ['fake_device'])
+        self.firewall.update_security_group_members.assert_called_once_with(
+            'fake_sgid2', self.sg_members)
+        self.assertFalse(self.firewall.update_port_filter.called)
+
+    def test_security_groups_member_updated_rpc_failure(self):
+        self.agent.refresh_firewall = mock.Mock()
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.side_effect = (
+            rpc_common.RemoteError('Exception'))
+        self.agent.security_groups_member_updated(['fake_sgid2'])
+        self.agent.refresh_firewall.assert_called_once_with(
+            [self.fake_device])
+
+    def test_prepare_devices_filter_falls_back_for_old_plugin(self):
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.side_effect = (
+            rpc_common.RemoteError('UnsupportedRpcVersion'))
+        self.agent.prepare_devices_filter(['fake_device'])
+        rpc.security_group_rules_for_devices.assert_called_once_with(
+            None, ['fake_device'])
+        self.assertFalse(self.agent.use_ipset)
+        self.firewall.assert_has_calls([
+            call.defer_apply(),
+            call.prepare_port_filter(self.fake_device)])
+
+
 class FakeSGRpcApi(agent_rpc.PluginApi,
                    sg_rpc.SecurityGroupServerRpcApiMixin):
     pass
@@ -602,6 +927,29 @@ class SecurityGroupServerRpcApiTestCase(base.BaseTestCase):
              version=sg_rpc.SG_RPC_VERSION,
              topic='fake_topic')])
 
+    def test_security_group_info_for_devices(self):
+        self.rpc.security_group_info_for_devices(None, ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+             'method': 'security_group_info_for_devices',
+             'namespace': None},
+             version='1.3',
+             topic='fake_topic')])
+
+    def test_security_group_compact_info_for_devices(self):
+        self.rpc.security_group_compact_info_for_devices(None,
+                                                         ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+             'method': 'security_group_compact_info_for_devices',
+             'namespace': None},
+             version='1.4',
+             topic='fake_topic')])
+
 
 class FakeSGNotifierAPI(proxy.RpcProxy,
                         sg_rpc.SecurityGroupAgentRpcApiMixin):
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the range and bitmap IPAM drivers.
+
+For each pool size a subnet is created, fragmented with random specific
+allocations, and then timed while generating and recycling addresses.
+The database defaults to an in-memory SQLite database; pass
+--sql-connection to run against a real server.
+
+    python tools/benchmarks/ipam_drivers.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import random
+import time
+
+import netaddr
+from oslo.config import cfg
+
+from neutron.common import config  # noqa
+from neutron import context
+from neutron.db import api as db
+from neutron.db import db_base_plugin_v2
+from neutron.db import ipam_db  # noqa
+
+DRIVERS = ['neutron.db.ipam_db.RangeIpamDriver',
+           'neutron.db.ipam_db.BitmapIpamDriver']
+Plugin = db_base_plugin_v2.NeutronDbPluginV2
+
+
+def _create_subnet(plugin, ctx, size):
+    network = plugin.create_network(ctx, {'network': {
+        'name': 'bench', 'admin_state_up': True, 'shared': False,
+        'tenant_id': 'bench'}})
+    first = netaddr.IPAddress('10.0.0.2')
+    subnet = plugin.create_subnet(ctx, {'subnet': {
+        'name': 'bench', 'network_id': network['id'], 'ip_version': 4,
+        'cidr': '10.0.0.0/8', 'enable_dhcp': False,
+        'gateway_ip': '10.0.0.1', 'tenant_id': 'bench',
+        'allocation_pools': [{'start': str(first),
+                              'end': str(first + size - 1)}],
+        'dns_nameservers': [], 'host_routes': []}})
+    return subnet, first
+
+
+def _timed(ctx, func, args_list):
+    start = time.time()
+    for args in args_list:
+        with ctx.session.begin(subtransactions=True):
+            func(ctx, *args)
+    return (time.time() - start) * 1000.0 / max(len(args_list), 1)
+
+
+def run(driver, size, fragments, operations):
+    cfg.CONF.set_override('ipam_driver', driver)
+    db.clear_db()
+    plugin = Plugin()
+    ctx = context.get_admin_context()
+    subnet, first = _create_subnet(plugin, ctx, size)
+    rand = random.Random(size)
+    # Odd offsets only, so generated addresses never collide with them
+    offsets = rand.sample(xrange(1, size, 2), min(fragments, size // 2))
+    specific = [(subnet['id'], str(first + offset)) for offset in offsets]
+    results = {'specific': _timed(ctx, Plugin._allocate_specific_ip,
+                                  specific)}
+    generated = []
+
+    def _generate(ctx):
+        generated.append(Plugin._generate_ip(ctx, [subnet])['ip_address'])
+
+    results['generate'] = _timed(ctx, _generate, [()] * operations)
+    results['recycle'] = _timed(
+        ctx, Plugin._recycle_ip,
+        [(subnet['network_id'], subnet['id'], ip) for ip in generated])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--fragments', type=int, default=1000,
+                        help='Specific allocations made before timing')
+    parser.add_argument('--operations', type=int, default=500,
+                        help='Addresses generated and recycled per run')
+    parser.add_argument('--sql-connection', default='sqlite://')
+    args = parser.parse_args()
+    cfg.CONF([], project='neutron')
+    cfg.CONF.set_override('connection', args.sql_connection, 'database')
+
+    print('%-8s %-8s %12s %12s %12s' % ('driver', 'size', 'specific ms',
+                                        'generate ms', 'recycle ms'))
+    for size in args.sizes:
+        for driver in DRIVERS:
+            results = run(driver, size, args.fragments, args.operations)
+            print('%-8s %-8d %12.3f %12.3f %12.3f' % (
+                driver.rsplit('.', 1)[1][:-len('IpamDriver')].lower(), size,
+                results['specific'], results['generate'],
+                results['recycle']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the payload size and server time of security group RPCs.
+
+Ports are spread over security groups which all allow a few ports and
+ingress traffic from their own members. Each RPC is called once for all
+the ports, like an agent resyncing, and the compact RPC is timed both
+with a cold and a warm cache. The database defaults to an in-memory
+SQLite database; pass --sql-connection to run against a real server.
+
+    python tools/benchmarks/sg_rpc.py --ports 1000 --groups 10
+"""
+
+import argparse
+import time
+
+from oslo.config import cfg
+
+from neutron.api.v2 import attributes
+from neutron.common import config  # noqa
+from neutron import context
+from neutron.db import db_base_plugin_v2
+from neutron.db import securitygroups_rpc_base as sg_db_rpc
+from neutron.openstack.common import jsonutils
+
+RULES = [('tcp', 22), ('tcp', 80), ('tcp', 443), ('udp', 53)]
+
+
+class BenchPlugin(db_base_plugin_v2.NeutronDbPluginV2,
+                  sg_db_rpc.SecurityGroupServerRpcMixin,
+                  sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
+
+    def get_port_from_device(self, device):
+        port = self.get_port(context.get_admin_context(), device)
+        port['security_group_rules'] = []
+        port['security_group_source_groups'] = []
+        port['fixed_ips'] = [ip['ip_address'] for ip in port['fixed_ips']]
+        return port
+
+
+def _rule(sg_id, protocol=None, port=None, remote_group_id=None):
+    return {'security_group_rule': {
+        'security_group_id': sg_id, 'tenant_id': 'bench',
+        'direction': 'ingress', 'ethertype': 'IPv4',
+        'protocol': protocol, 'port_range_min': port,
+        'port_range_max': port, 'remote_ip_prefix': None,
+        'remote_group_id': remote_group_id}}
+
+
+def setup(plugin, ctx, ports, groups):
+    network = plugin.create_network(ctx, {'network': {
+        'name': 'bench', 'admin_state_up': True, 'shared': False,
+        'tenant_id': 'bench'}})
+    plugin.create_subnet(ctx, {'subnet': {
+        'name': 'bench', 'network_id': network['id'], 'ip_version': 4,
+        'cidr': '10.0.0.0/16', 'enable_dhcp': True,
+        'gateway_ip': '10.0.0.1', 'tenant_id': 'bench',
+        'allocation_pools': attributes.ATTR_NOT_SPECIFIED,
+        'dns_nameservers': [], 'host_routes': []}})
+    sg_ids = []
+    for i in range(groups):
+        sg = plugin.create_security_group(ctx, {'security_group': {
+            'name': 'bench%d' % i, 'description': '',
+            'tenant_id': 'bench'}}, default_sg=True)
+        rules = [_rule(sg['id'], protocol, port) for protocol, port in RULES]
+        rules.append(_rule(sg['id'], remote_group_id=sg['id']))
+        plugin.create_security_group_rule_bulk_native(
+            ctx, {'security_group_rules': rules})
+        sg_ids.append(sg['id'])
+    device_ids = []
+    for i in range(ports):
+        with ctx.session.begin(subtransactions=True):
+            port = plugin.create_port(ctx, {'port': {
+                'name': '', 'network_id': network['id'],
+                'tenant_id': 'bench', 'admin_state_up': True,
+                'mac_address': attributes.ATTR_NOT_SPECIFIED,
+                'fixed_ips': attributes.ATTR_NOT_SPECIFIED,
+                'device_id': 'vm%d' % i, 'device_owner': 'compute:bench'}})
+            plugin._process_port_create_security_group(
+                ctx, port, [sg_ids[i % groups]])
+        device_ids.append(port['id'])
+    return device_ids
+
+
+def measure(func, ctx, devices):
+    start = time.time()
+    result = func(ctx, devices=devices)
+    elapsed = time.time() - start
+    return len(jsonutils.dumps(result)), elapsed * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ports', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--sql-connection', default='sqlite://')
+    args = parser.parse_args()
+    cfg.CONF([], project='neutron')
+    cfg.CONF.set_override('connection', args.sql_connection, 'database')
+
+    plugin = BenchPlugin()
+    ctx = context.get_admin_context()
+    devices = setup(plugin, ctx, args.ports, args.groups)
+
+    sg_db_rpc.sg_info_cache.clear()
+    results = [
+        ('rules_for_devices',
+         measure(plugin.security_group_rules_for_devices, ctx, devices)),
+        ('info_for_devices',
+         measure(plugin.security_group_info_for_devices, ctx, devices)),
+        ('compact (cold)',
+         measure(plugin.security_group_compact_info_for_devices,
+                 ctx, devices)),
+        ('compact (warm)',
+         measure(plugin.security_group_compact_info_for_devices,
+                 ctx, devices)),
+    ]
+    print('%-18s %14s %12s' % ('rpc', 'payload bytes', 'server ms'))
+    for name, (size, elapsed) in results:
+        print('%-18s %14d %12.1f' % (name, size, elapsed))
+
+
+if __name__ == '__main__':
+    main()